@@ -1,23 +1,8 @@
 import os
 
 from flask import Flask
-from flask.json import JSONEncoder
-from datetime import date
 
-from flaskr import db, auth, products, orders, shopping_cart, shippers
-
-
-class CustomJSONEncoder(JSONEncoder):
-    def default(self, obj):
-        try:
-            if isinstance(obj, date):
-                return obj.strftime('%Y-%m-%d %H:%M:%S.%f')
-            iterable = iter(obj)
-        except TypeError:
-            pass
-        else:
-            return list(iterable)
-        return JSONEncoder.default(self, obj)
+from flaskr import db, auth, products, orders, shopping_cart, shippers, analytics, instrumentation, migrate, serialization, compression
 
 
 app = Flask(__name__, instance_relative_config=True)
@@ -25,10 +10,48 @@ app.config.from_mapping(
     SECRET_KEY='dev',
     # DATABASE=os.path.join(app.instance_path, 'flaskr.sqlite'),
     DATABASE='flaskr.sqlite',
+    DATABASE_POOL_SIZE=8,
+    DATABASE_BUSY_RETRIES=5,
+    DATABASE_BUSY_BACKOFF=0.05,
+    SQLITE_PRAGMAS={
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -16000,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+    },
+    MAX_PAGE_SIZE=1000,
+    INSTRUMENTATION=False,
+    SQL_REPEAT_THRESHOLD=5,
+    # 'local' keeps a cache per worker, 'redis' shares one through CATALOG_CACHE_URL, None disables it.
+    CATALOG_CACHE_BACKEND='local',
+    CATALOG_CACHE_URL=None,
+    CATALOG_CACHE_MAXSIZE=10000,
+    CATALOG_CACHE_TTL=60,
+    # Seconds a worker serves a cached cart before checking it against the database.
+    CART_CACHE_REVALIDATE_AFTER=1,
+    REQUIRE_MIGRATIONS=False,
+    MIGRATION_BACKFILL_CHUNK_SIZE=1000,
+    MIGRATION_BACKFILL_PAUSE=0.01,
+    # 'orjson' or 'json'; 'auto' uses orjson when it is installed.
+    JSON_BACKEND='auto',
+    # Brotli is used when installed and accepted, gzip otherwise.
+    COMPRESSION_ENABLED=True,
+    COMPRESSION_MIN_SIZE=1024,
+    COMPRESSION_MIMETYPES=['application/json', 'application/x-ndjson', 'text/html', 'text/plain'],
+    COMPRESSION_GZIP_LEVEL=6,
+    COMPRESSION_BROTLI_QUALITY=5,
+    SNAPSHOT_MAXSIZE=64,
+    SNAPSHOT_TTL=300,
+    # Limits for the ASGI entry point, asgi.py. It raises DATABASE_POOL_SIZE to
+    # ASGI_THREADS, so every thread keeps a pooled connection.
+    ASGI_THREADS=16,
+    ASGI_MAX_CONCURRENCY=64,
+    ASGI_QUEUE_TIMEOUT=30,
 )
+app.config.from_envvar('FLASKR_SETTINGS', silent=True)
 
 app.config['JSON_SORT_KEYS'] = False
-app.json_encoder = CustomJSONEncoder
 
 
 @app.route('/index')
@@ -36,20 +59,18 @@ def index():
     return 'Welcome to our Online Shop!'
 
 
-@app.route('/init-db')
-def initialize_database():
-    db.init_db()
-    return {
-        'message': 'Database Initialized'
-    }
-
-
 db.init_app(app)
+serialization.init_app(app)
+compression.init_app(app)
+instrumentation.init_app(app)
+analytics.init_app(app)
+migrate.init_app(app)
 app.register_blueprint(auth.bp)
 app.register_blueprint(products.bp)
 app.register_blueprint(shopping_cart.bp)
 app.register_blueprint(orders.bp)
 app.register_blueprint(shippers.bp)
+app.register_blueprint(analytics.bp)
 app.add_url_rule('/', endpoint='index')
 
 
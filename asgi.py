@@ -0,0 +1,8 @@
+"""ASGI entry point, serving the same app as app.py: ``uvicorn asgi:app``.
+
+``gunicorn app:app`` keeps serving it over WSGI.
+"""
+from app import app as wsgi_app
+from flaskr.asgi import ASGIApp
+
+app = ASGIApp(wsgi_app)
@@ -0,0 +1,711 @@
+"""Load-test every blueprint against a synthetic dataset.
+
+Builds a fresh SQLite database at the requested scale, then times each route
+either in-process through the Flask test client or over HTTP against a real
+gunicorn server, and writes per-route latency percentiles and throughput as
+JSON so runs from different commits can be compared:
+
+    python benchmarks/benchmark.py run --mode client --output before.json
+    python benchmarks/benchmark.py run --mode gunicorn --workers 4 --concurrency 8 --output after.json
+    python benchmarks/benchmark.py compare before.json after.json
+
+``--pool-size`` overrides DATABASE_POOL_SIZE, so the connection pool can be
+compared against opening a connection per request:
+
+    python benchmarks/benchmark.py run --mode gunicorn --concurrency 8 --pool-size 0 --output no-pool.json
+    python benchmarks/benchmark.py run --mode gunicorn --concurrency 8 --pool-size 8 --output pool.json
+    python benchmarks/benchmark.py compare no-pool.json pool.json
+"""
+import http.client
+import itertools
+import json
+import os
+import platform
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from werkzeug.security import generate_password_hash
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import app  # noqa: E402
+from flaskr.orders import checkout  # noqa: E402
+from flaskr.products import insert_products  # noqa: E402
+from flaskr.db import get_db, init_db  # noqa: E402
+
+PASSWORD = 'benchmark'
+
+ADJECTIVES = ['red', 'compact', 'wireless', 'organic', 'vintage', 'smart', 'heavy', 'portable', 'classic', 'silent']
+NOUNS = ['lamp', 'keyboard', 'kettle', 'backpack', 'speaker', 'jacket', 'blender', 'monitor', 'chair', 'watch']
+CATEGORIES = ['Electronics', 'Home', 'Kitchen', 'Outdoors', 'Fashion', 'Office', 'Sports', 'Toys']
+
+
+def build_dataset(path, users, products, tags, carts, orders, seed):
+    """Create a database at ``path`` filled with reproducible synthetic data."""
+    rng = random.Random(seed)
+    app.config['DATABASE'] = path
+    now = datetime.now()
+
+    with app.app_context():
+        init_db()
+        db = get_db()
+
+        # Hashing is deliberately slow, so every synthetic user shares one hash.
+        password = generate_password_hash(PASSWORD)
+
+        with db:
+            db.executemany(
+                'INSERT INTO user (username, password, name, role, joined_at) VALUES (?, ?, ?, ?, ?)',
+                [(f'bench-user-{i}', password, f'User {i}', 'customer', now) for i in range(users)]
+            )
+
+            db.executemany(
+                'INSERT INTO shipper (shipper_id, shipper_name, phone_number, created_at, created_by) VALUES (?, ?, ?, ?, ?)',
+                [(f'bench-shipper-{i}', f'Shipper {i}', f'555-{i:04d}', now, 'admin') for i in range(5)]
+            )
+
+        catalog = []
+
+        for i in range(products):
+            category = rng.choice(CATEGORIES)
+            catalog.append({
+                'product_name': f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {i}',
+                'description': f'A {rng.choice(ADJECTIVES)} item for {category.lower()} use.',
+                'product_category': category,
+                'price': round(rng.uniform(5, 500), 2),
+                'discount': round(rng.uniform(0, 5), 2),
+                'in_stock': 1000000,
+                'tags': [f'tag-{rng.randrange(tags)}' for _ in range(rng.randint(1, 3))] if tags else []
+            })
+
+        for start in range(0, len(catalog), 1000):
+            with db:
+                insert_products(db, catalog[start:start + 1000], now - timedelta(days=rng.randrange(365)), 'admin')
+
+        product_ids = [product['product_id'] for product in catalog]
+
+        def fill_cart(cart_id, username, created_at):
+            db.execute(
+                "INSERT INTO shopping_cart_info (cart_id, username, status, created_at, updated_at) VALUES (?, ?, 'active', ?, ?)",
+                (cart_id, username, created_at, created_at)
+            )
+            db.executemany(
+                'INSERT INTO product_by_cart (cart_id, product_id, quantity, added_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+                [
+                    (cart_id, product_id, rng.randint(1, 3), created_at, created_at)
+                    for product_id in rng.sample(product_ids, min(len(product_ids), rng.randint(1, 5)))
+                ]
+            )
+
+        for i in range(orders if product_ids and users else 0):
+            created_at = now - timedelta(days=rng.randrange(365), seconds=rng.randrange(86400))
+            username = f'bench-user-{rng.randrange(users)}'
+
+            with db:
+                fill_cart(f'bench-order-{i}', username, created_at)
+                checkout(db, f'bench-order-{i}', username, created_at, 'card', f'{i} Benchmark Street')
+
+                if rng.random() < 0.5:
+                    db.execute(
+                        'UPDATE order_info SET shipper_id = ?, date_shipped = ?, shipment_created_by = ? WHERE order_id = ?',
+                        (f'bench-shipper-{rng.randrange(5)}', created_at, 'admin', f'bench-order-{i}')
+                    )
+
+        # Users beyond the benchmark's own sessions get a waiting cart.
+        with db:
+            for i in range(carts if product_ids else 0):
+                if i >= users:
+                    break
+
+                fill_cart(f'bench-cart-{i}', f'bench-user-{users - 1 - i}', now)
+
+    from flaskr.analytics import rebuild_rollups
+
+    with app.app_context():
+        rebuild_rollups(get_db())
+
+    return product_ids
+
+
+class ClientSession:
+    """Issues requests in-process through the Flask test client."""
+
+    def __init__(self):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None):
+        response = self.client.open(path, method=method, json=body)
+        data = response.get_data()
+        response.close()
+        return response.status_code, data
+
+
+class HTTPSession:
+    """Issues requests to a running server, keeping its session cookie."""
+
+    def __init__(self, host, port):
+        self.connection = http.client.HTTPConnection(host, port, timeout=60)
+        self.cookies = {}
+
+    def request(self, method, path, body=None):
+        headers = {}
+
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+
+        for attempt in range(2):
+            try:
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self.connection.close()
+
+                if attempt == 1:
+                    raise
+
+        for header in response.headers.get_all('Set-Cookie') or []:
+            name, _, value = header.split(';', 1)[0].partition('=')
+            self.cookies[name.strip()] = value.strip()
+
+        if response.getheader('Connection', '').lower() == 'close':
+            self.connection.close()
+
+        return response.status, data
+
+
+class Context:
+    """State one benchmark thread needs to build requests."""
+
+    def __init__(self, new_session, index, product_ids, seed):
+        self.new_session = new_session
+        self.rng = random.Random(seed + index)
+        self.product_ids = product_ids
+        self.username = f'bench-user-{index}'
+
+        self.admin = new_session()
+        login(self.admin, 'admin', 'admin')
+
+        self.customer = new_session()
+        login(self.customer, self.username, PASSWORD)
+
+        self.anonymous = new_session()
+
+    def products(self, count):
+        return self.rng.sample(self.product_ids, count)
+
+
+counter = itertools.count()
+registered = []
+
+
+def login(session, username, password):
+    status, data = session.request('POST', '/auth/login', {'username': username, 'password': password})
+
+    if status != 200 or not json.loads(data)['isSuccess']:
+        raise click.ClickException(f'Could not log in as {username}: {data[:200]!r}')
+
+
+def new_product():
+    n = next(counter)
+    return {
+        'product_name': f'benchmark product {n}',
+        'description': f'Created by the benchmark run {n}.',
+        'product_category': 'Benchmark',
+        'price': 10.0,
+        'discount': 0.0,
+        'in_stock': 1000000,
+        'tags': ['benchmark']
+    }
+
+
+def add_products(ctx, count):
+    status, data = ctx.admin.request('POST', '/products/add-product', {'products': [new_product() for _ in range(count)]})
+    return [product['product_id'] for product in json.loads(data)['inserted_products']]
+
+
+def fill_customer_cart(ctx, session, count=3):
+    session.request('POST', '/shopping-cart/add-to-cart', {
+        'products': [{'product_id': product_id, 'quantity': 1} for product_id in ctx.products(count)]
+    })
+
+
+def register(ctx):
+    username = f'bench-new-{next(counter)}-{os.getpid()}'
+    registered.append(username)
+    return ctx.anonymous, 'POST', '/auth/register', {'username': username, 'password': PASSWORD}
+
+
+def login_request(ctx):
+    username = f'bench-user-{ctx.rng.randrange(user_count)}'
+    return ctx.anonymous, 'POST', '/auth/login', {'username': username, 'password': PASSWORD}
+
+
+def logout(ctx):
+    return ctx.anonymous, 'POST', '/auth/logout', None
+
+
+def grant_admin_permission(ctx):
+    username = registered.pop() if registered else 'bench-missing-user'
+    return ctx.admin, 'POST', '/auth/grant-admin-permission', {'usernames': [username]}
+
+
+def delete_account(ctx):
+    session = ctx.new_session()
+    username = f'bench-delete-{next(counter)}-{os.getpid()}'
+    session.request('POST', '/auth/register', {'username': username, 'password': PASSWORD})
+    login(session, username, PASSWORD)
+    return session, 'DELETE', '/auth/delete-account', {'password': PASSWORD}
+
+
+def add_product(ctx):
+    return ctx.admin, 'POST', '/products/add-product', {'products': [new_product()]}
+
+
+def update_product(ctx):
+    return ctx.admin, 'PUT', f'/products/update-product/{ctx.products(1)[0]}', {'price': round(ctx.rng.uniform(5, 500), 2)}
+
+
+def bulk_update(ctx):
+    return ctx.admin, 'PUT', '/products/bulk-update', {
+        'products': [{'product_id': product_id, 'price': round(ctx.rng.uniform(5, 500), 2)} for product_id in ctx.products(20)]
+    }
+
+
+def delete_product(ctx):
+    return ctx.admin, 'DELETE', f'/products/delete-product/{add_products(ctx, 1)[0]}', None
+
+
+def bulk_delete(ctx):
+    return ctx.admin, 'DELETE', '/products/bulk-delete', {'product_ids': add_products(ctx, 10)}
+
+
+def all_products_admin(ctx):
+    return ctx.admin, 'GET', '/products/all-products?limit=50', None
+
+
+def all_products_customer(ctx):
+    return ctx.customer, 'GET', '/products/all-products?limit=50', None
+
+
+def all_products_full(ctx):
+    return ctx.customer, 'GET', '/products/all-products', None
+
+
+def product_details(ctx):
+    return ctx.customer, 'GET', f'/products/product-details/{ctx.products(1)[0]}', None
+
+
+def search_products(ctx):
+    return ctx.customer, 'GET', f'/products/search-products?q={ctx.rng.choice(ADJECTIVES)}+{ctx.rng.choice(NOUNS)}&limit=20', None
+
+
+def add_to_wishlist(ctx):
+    return ctx.customer, 'POST', '/products/add-products-to-wishlist', {'product_ids': ctx.products(1)}
+
+
+def wishlist_products(ctx):
+    return ctx.customer, 'GET', '/products/wishlist-products', None
+
+
+def remove_from_wishlist(ctx):
+    product_id = ctx.products(1)[0]
+    ctx.customer.request('POST', '/products/add-products-to-wishlist', {'product_ids': [product_id]})
+    return ctx.customer, 'POST', f'/products/remove-product-from-wishlist/{product_id}', None
+
+
+def add_to_cart(ctx):
+    return ctx.customer, 'POST', '/shopping-cart/add-to-cart', {
+        'products': [{'product_id': product_id, 'quantity': 1} for product_id in ctx.products(3)]
+    }
+
+
+def products_in_cart(ctx):
+    return ctx.customer, 'GET', '/shopping-cart/get-products-in-cart', None
+
+
+def delete_from_cart(ctx):
+    product_id = ctx.products(1)[0]
+    ctx.customer.request('POST', '/shopping-cart/add-to-cart', {'products': [{'product_id': product_id, 'quantity': 1}]})
+    return ctx.customer, 'DELETE', f'/shopping-cart/delete-from-shopping-cart/{product_id}', None
+
+
+def make_order(ctx):
+    fill_customer_cart(ctx, ctx.customer)
+    return ctx.customer, 'POST', '/orders/make-order', {'payment_method': 'card', 'delivery_address': '1 Benchmark Street'}
+
+
+def all_orders(ctx):
+    return ctx.customer, 'GET', '/orders/get-all-orders', None
+
+
+def all_customers_orders(ctx):
+    return ctx.admin, 'GET', '/orders/get-all-customers-orders?limit=50', None
+
+
+def export_orders(ctx):
+    return ctx.admin, 'GET', '/orders/export-customers-orders', None
+
+
+def create_shippers(ctx):
+    n = next(counter)
+    return ctx.admin, 'POST', '/shippers/create-shippers', {'shippers': [{'shipper_name': f'Shipper {n}', 'phone_number': f'555-{n}'}]}
+
+
+def create_shipment(ctx):
+    fill_customer_cart(ctx, ctx.customer)
+    _, data = ctx.customer.request('POST', '/orders/make-order', {'payment_method': 'card', 'delivery_address': '1 Benchmark Street'})
+    return ctx.admin, 'POST', '/shippers/create-shipment', {
+        'shipper_id': f'bench-shipper-{ctx.rng.randrange(5)}',
+        'order_ids': [json.loads(data).get('order_id')]
+    }
+
+
+def all_shippers(ctx):
+    return ctx.admin, 'GET', '/shippers/all-shippers', None
+
+
+def analytics(path):
+    def prepare(ctx):
+        return ctx.admin, 'GET', path, None
+
+    return prepare
+
+
+# (blueprint, route name, request builder). A builder may send untimed setup
+# requests and returns the session, method, path and JSON body to time.
+ROUTES = [
+    ('auth', 'POST /auth/register', register),
+    ('auth', 'POST /auth/login', login_request),
+    ('auth', 'POST /auth/logout', logout),
+    ('auth', 'POST /auth/grant-admin-permission', grant_admin_permission),
+    ('auth', 'DELETE /auth/delete-account', delete_account),
+    ('products', 'POST /products/add-product', add_product),
+    ('products', 'PUT /products/update-product/<id>', update_product),
+    ('products', 'PUT /products/bulk-update', bulk_update),
+    ('products', 'DELETE /products/delete-product/<id>', delete_product),
+    ('products', 'DELETE /products/bulk-delete', bulk_delete),
+    ('products', 'GET /products/all-products?limit=50 [admin]', all_products_admin),
+    ('products', 'GET /products/all-products?limit=50 [customer]', all_products_customer),
+    ('products', 'GET /products/all-products [customer]', all_products_full),
+    ('products', 'GET /products/product-details/<id>', product_details),
+    ('products', 'GET /products/search-products', search_products),
+    ('products', 'POST /products/add-products-to-wishlist', add_to_wishlist),
+    ('products', 'GET /products/wishlist-products', wishlist_products),
+    ('products', 'POST /products/remove-product-from-wishlist/<id>', remove_from_wishlist),
+    ('shopping_cart', 'POST /shopping-cart/add-to-cart', add_to_cart),
+    ('shopping_cart', 'GET /shopping-cart/get-products-in-cart', products_in_cart),
+    ('shopping_cart', 'DELETE /shopping-cart/delete-from-shopping-cart/<id>', delete_from_cart),
+    ('orders', 'POST /orders/make-order', make_order),
+    ('orders', 'GET /orders/get-all-orders', all_orders),
+    ('orders', 'GET /orders/get-all-customers-orders?limit=50', all_customers_orders),
+    ('orders', 'GET /orders/export-customers-orders', export_orders),
+    ('shippers', 'POST /shippers/create-shippers', create_shippers),
+    ('shippers', 'POST /shippers/create-shipment', create_shipment),
+    ('shippers', 'GET /shippers/all-shippers', all_shippers),
+    ('analytics', 'GET /analytics/revenue-by-day', analytics('/analytics/revenue-by-day')),
+    ('analytics', 'GET /analytics/top-products', analytics('/analytics/top-products')),
+    ('analytics', 'GET /analytics/revenue-by-category', analytics('/analytics/revenue-by-category')),
+    ('analytics', 'GET /analytics/revenue-by-shipper', analytics('/analytics/revenue-by-shipper')),
+]
+
+user_count = 0
+
+
+def is_error(status, data):
+    if status >= 400:
+        return True
+
+    if data[:1] != b'{':
+        return False
+
+    try:
+        return json.loads(data).get('isSuccess') is False
+    except ValueError:
+        return False
+
+
+def percentile(samples, fraction):
+    # Nearest-rank percentile of already sorted samples.
+    return samples[max(0, min(len(samples) - 1, int(round(fraction * len(samples) + 0.5)) - 1))]
+
+
+def measure(contexts, prepare, requests, warmup):
+    """Time ``requests`` calls split across one thread per context."""
+    samples = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(ctx, count):
+        for _ in range(warmup):
+            session, method, path, body = prepare(ctx)
+            session.request(method, path, body)
+
+        local_samples = []
+        local_errors = 0
+
+        for _ in range(count):
+            session, method, path, body = prepare(ctx)
+            started_at = time.perf_counter()
+            status, data = session.request(method, path, body)
+            local_samples.append(time.perf_counter() - started_at)
+            local_errors += is_error(status, data)
+
+        with lock:
+            samples.extend(local_samples)
+            errors.append(local_errors)
+
+    counts = [requests // len(contexts) + (index < requests % len(contexts)) for index in range(len(contexts))]
+    threads = [threading.Thread(target=worker, args=(ctx, count)) for ctx, count in zip(contexts, counts)]
+
+    started_at = time.perf_counter()
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    elapsed = time.perf_counter() - started_at
+
+    samples.sort()
+
+    return {
+        'requests': len(samples),
+        'errors': sum(errors),
+        'mean_ms': round(sum(samples) / len(samples) * 1000, 3),
+        'p50_ms': round(percentile(samples, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 3),
+        'max_ms': round(samples[-1] * 1000, 3),
+        # Wall time includes untimed setup requests, so throughput is a lower bound.
+        'throughput_rps': round(len(samples) / elapsed, 1)
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(name, args, database, config=None):
+    """Start ``python -m <args>`` serving ``database`` on a free port and wait until it answers.
+
+    ``config`` holds further settings for the app, written next to DATABASE.
+    """
+    settings = os.path.join(os.path.dirname(database), 'settings.cfg')
+
+    with open(settings, 'w', encoding='utf8') as f:
+        f.write(f'DATABASE = {database!r}\n')
+
+        for key, value in (config or {}).items():
+            f.write(f'{key} = {value!r}\n')
+
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, '-m'] + [arg.format(port=port) for arg in args],
+        cwd=ROOT,
+        env=dict(os.environ, FLASKR_SETTINGS=settings)
+    )
+
+    deadline = time.monotonic() + 30
+
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise click.ClickException(f'{name} exited during startup.')
+
+        try:
+            status, _ = HTTPSession('127.0.0.1', port).request('GET', '/index')
+
+            if status == 200:
+                return server, port
+        except OSError:
+            time.sleep(0.2)
+
+    server.terminate()
+    raise click.ClickException(f'{name} did not start within 30 seconds.')
+
+
+def start_gunicorn(database, workers, threads, config=None):
+    return start_server(
+        'gunicorn',
+        [
+            'gunicorn',
+            '--bind', '127.0.0.1:{port}',
+            '--workers', str(workers),
+            '--threads', str(threads),
+            '--log-level', 'warning',
+            'app:app'
+        ],
+        database,
+        config
+    )
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.option('--mode', type=click.Choice(['client', 'gunicorn']), default='client', show_default=True)
+@click.option('--scale', default=1.0, show_default=True, help='Multiplier applied to every dataset size.')
+@click.option('--users', default=200, show_default=True)
+@click.option('--products', default=2000, show_default=True)
+@click.option('--tags', default=50, show_default=True)
+@click.option('--carts', default=50, show_default=True)
+@click.option('--orders', default=1000, show_default=True)
+@click.option('--requests', default=100, show_default=True, help='Timed requests per route.')
+@click.option('--warmup', default=5, show_default=True, help='Untimed requests per route and thread.')
+@click.option('--concurrency', default=1, show_default=True, help='Threads issuing requests at once.')
+@click.option('--workers', default=2, show_default=True, help='gunicorn worker processes.')
+@click.option('--threads', default=1, show_default=True, help='Threads per gunicorn worker.')
+@click.option('--pool-size', type=int, help='DATABASE_POOL_SIZE for the app; 0 disables pooling.')
+@click.option('--route', 'route_filters', multiple=True, help='Only run routes whose name contains this text.')
+@click.option('--seed', default=1, show_default=True)
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the results as JSON to this file.')
+def run(mode, scale, users, products, tags, carts, orders, requests, warmup, concurrency, workers, threads, pool_size, route_filters, seed, output):
+    """Build a synthetic dataset and time every route against it."""
+    global user_count
+
+    dataset = {
+        'users': max(int(users * scale), concurrency),
+        'products': max(int(products * scale), 20),
+        'tags': int(tags * scale),
+        'carts': int(carts * scale),
+        'orders': int(orders * scale)
+    }
+    user_count = dataset['users']
+    directory = tempfile.mkdtemp(prefix='flaskr-benchmark-')
+    database = os.path.join(directory, 'benchmark.sqlite')
+
+    started_at = time.perf_counter()
+    product_ids = build_dataset(database, seed=seed, **dataset)
+    click.echo(f'Built {dataset} in {time.perf_counter() - started_at:.1f}s at {database}', err=True)
+
+    if pool_size is not None:
+        app.config['DATABASE_POOL_SIZE'] = pool_size
+        # Building the dataset opened a pool of the configured size.
+        pool = app.extensions.pop('db_pool', None)
+
+        if pool is not None:
+            pool.close()
+
+    server = None
+
+    if mode == 'gunicorn':
+        server, port = start_gunicorn(database, workers, threads, {'DATABASE_POOL_SIZE': app.config['DATABASE_POOL_SIZE']})
+        new_session = lambda: HTTPSession('127.0.0.1', port)
+    else:
+        new_session = ClientSession
+
+    results = {}
+
+    try:
+        contexts = [Context(new_session, index, product_ids, seed) for index in range(concurrency)]
+
+        for blueprint, name, prepare in ROUTES:
+            if route_filters and not any(route_filter in name for route_filter in route_filters):
+                continue
+
+            results[name] = dict(blueprint=blueprint, **measure(contexts, prepare, requests, warmup))
+            result = results[name]
+            click.echo(
+                f'{name:<60} p50 {result["p50_ms"]:>9.2f}ms  p95 {result["p95_ms"]:>9.2f}ms  '
+                f'p99 {result["p99_ms"]:>9.2f}ms  {result["throughput_rps"]:>8.1f} req/s  {result["errors"]} errors',
+                err=True
+            )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report = {
+        'commit': git_commit(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'mode': mode,
+        'workers': workers if mode == 'gunicorn' else None,
+        'threads': threads if mode == 'gunicorn' else None,
+        'concurrency': concurrency,
+        'pool_size': app.config['DATABASE_POOL_SIZE'],
+        'requests_per_route': requests,
+        'seed': seed,
+        'dataset': dataset,
+        'routes': results
+    }
+
+    if output:
+        with open(output, 'w', encoding='utf8') as f:
+            json.dump(report, f, indent=2)
+    else:
+        click.echo(json.dumps(report, indent=2))
+
+
+@cli.command()
+@click.argument('baseline', type=click.File(encoding='utf8'))
+@click.argument('candidate', type=click.File(encoding='utf8'))
+@click.option('--threshold', default=0.2, show_default=True, help='Relative p95 slowdown reported as a regression.')
+def compare(baseline, candidate, threshold):
+    """Compare two result files and exit non-zero on p95 regressions."""
+    baseline = json.load(baseline)
+    candidate = json.load(candidate)
+    regressions = 0
+
+    click.echo(f'{baseline["commit"]} -> {candidate["commit"]}')
+
+    for setting in ['mode', 'workers', 'threads', 'concurrency', 'dataset']:
+        if baseline[setting] != candidate[setting]:
+            click.echo(f'Warning: {setting} differs ({baseline[setting]} -> {candidate[setting]}), results are not comparable.', err=True)
+
+    for name, result in candidate['routes'].items():
+        before = baseline['routes'].get(name)
+
+        if before is None:
+            click.echo(f'{name:<60} new route')
+            continue
+
+        change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] if before['p95_ms'] else 0
+        throughput = (result['throughput_rps'] - before['throughput_rps']) / before['throughput_rps'] if before['throughput_rps'] else 0
+        marker = ''
+
+        if change > threshold:
+            regressions += 1
+            marker = '  REGRESSION'
+
+        click.echo(
+            f'{name:<60} p95 {before["p95_ms"]:>9.2f}ms -> {result["p95_ms"]:>9.2f}ms ({change:+.0%})  '
+            f'throughput {throughput:+.0%}{marker}'
+        )
+
+    if regressions:
+        raise click.ClickException(f'{regressions} routes regressed by more than {threshold:.0%} at p95.')
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,153 @@
+"""Check that concurrent checkouts never oversell a product.
+
+Gives ``--customers`` customers a cart holding ``--quantity`` units of one
+product that only has ``--stock`` units, then releases all their
+make-order requests at once, either in-process or against a gunicorn
+server with several workers. Exits non-zero unless exactly as many orders
+were accepted as the stock covers and ``in_stock`` never went below 0:
+
+    python benchmarks/checkout_stress.py
+    python benchmarks/checkout_stress.py --mode gunicorn --workers 4 --customers 100 --stock 30 --quantity 3
+
+tests/test_checkout_stress.py runs the in-process scenario under pytest.
+"""
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark import ClientSession, HTTPSession, build_dataset, start_gunicorn  # noqa: E402
+from concurrency import session_cookie  # noqa: E402
+
+
+def run_checkout_stress(mode, customers, stock, quantity, workers=4):
+    """Release ``customers`` concurrent checkouts against ``stock`` units and report the outcome.
+
+    Returns a dict with the accepted orders, the units ordered, the final
+    and lowest observed ``in_stock``, and ``total_sold``.
+    """
+    database = os.path.join(tempfile.mkdtemp(prefix='flaskr-checkout-stress-'), 'checkout-stress.sqlite')
+    product_id = build_dataset(database, users=customers, products=1, tags=0, carts=0, orders=0, seed=1)[0]
+
+    with sqlite3.connect(database) as db:
+        db.execute('UPDATE product SET in_stock = ? WHERE product_id = ?', (stock, product_id))
+
+    server = None
+
+    if mode == 'gunicorn':
+        server, port = start_gunicorn(database, workers, 1)
+        new_session = lambda: HTTPSession('127.0.0.1', port)
+    else:
+        new_session = ClientSession
+
+    results = []
+    lowest_stock = [stock]
+    done = threading.Event()
+
+    def watch_stock():
+        with sqlite3.connect(database) as db:
+            while not done.is_set():
+                in_stock = db.execute('SELECT in_stock FROM product WHERE product_id = ?', (product_id,)).fetchone()[0]
+                lowest_stock[0] = min(lowest_stock[0], in_stock)
+                time.sleep(0.001)
+
+    try:
+        sessions = []
+
+        for index in range(customers):
+            session = new_session()
+            cookie_name, _, cookie_value = session_cookie(f'bench-user-{index}').partition('=')
+
+            if mode == 'gunicorn':
+                session.cookies[cookie_name] = cookie_value
+            else:
+                session.client.set_cookie('localhost', cookie_name, cookie_value)
+
+            status, data = session.request('POST', '/shopping-cart/add-to-cart', {'products': [{'product_id': product_id, 'quantity': quantity}]})
+
+            if status != 200 or not json.loads(data)['isSuccess']:
+                raise click.ClickException(f'Could not fill the cart of bench-user-{index}: {data[:200]!r}')
+
+            sessions.append(session)
+
+        barrier = threading.Barrier(customers)
+
+        def make_order(session):
+            barrier.wait()
+            status, data = session.request('POST', '/orders/make-order', {'payment_method': 'card', 'delivery_address': '1 Stress Street'})
+            results.append(status == 200 and json.loads(data)['isSuccess'])
+
+        watcher = threading.Thread(target=watch_stock)
+        watcher.start()
+        threads = [threading.Thread(target=make_order, args=(session,)) for session in sessions]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        done.set()
+        watcher.join()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    with sqlite3.connect(database) as db:
+        in_stock, total_sold = db.execute('SELECT in_stock, total_sold FROM product WHERE product_id = ?', (product_id,)).fetchone()
+        ordered = db.execute('SELECT COALESCE(SUM(quantity), 0) FROM order_lines WHERE product_id = ?', (product_id,)).fetchone()[0]
+
+    return {
+        'accepted': sum(results),
+        'ordered': ordered,
+        'in_stock': in_stock,
+        'lowest_stock': min(lowest_stock[0], in_stock),
+        'total_sold': total_sold,
+    }
+
+
+@click.command()
+@click.option('--mode', type=click.Choice(['client', 'gunicorn']), default='client', show_default=True)
+@click.option('--customers', default=40, show_default=True, help='Concurrent checkouts.')
+@click.option('--stock', default=10, show_default=True, help='Units of the contested product in stock.')
+@click.option('--quantity', default=1, show_default=True, help='Units in each customer\'s cart.')
+@click.option('--workers', default=4, show_default=True, help='gunicorn worker processes.')
+def checkout_stress(mode, customers, stock, quantity, workers):
+    if stock % quantity or customers * quantity <= stock:
+        raise click.BadParameter('--stock has to be a multiple of --quantity, and the carts have to ask for more than it.')
+
+    result = run_checkout_stress(mode, customers, stock, quantity, workers)
+    accepted, ordered, in_stock, total_sold = result['accepted'], result['ordered'], result['in_stock'], result['total_sold']
+    click.echo(
+        f'{accepted}/{customers} orders accepted, {ordered} units ordered, in_stock {in_stock} '
+        f'(lowest seen {result["lowest_stock"]}), total_sold {total_sold}'
+    )
+
+    failures = []
+
+    if accepted * quantity != stock:
+        failures.append(f'accepted orders cover {accepted * quantity} units, expected the whole stock of {stock}')
+
+    if ordered != accepted * quantity or total_sold != ordered:
+        failures.append('order lines and total_sold do not match the accepted orders')
+
+    if in_stock != 0 or result['lowest_stock'] < 0:
+        failures.append('in_stock went below 0 or was not used up')
+
+    for failure in failures:
+        click.echo(f'FAILED: {failure}', err=True)
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    checkout_stress()
@@ -0,0 +1,201 @@
+"""Compare the sync gunicorn and the ASGI deployments under many open connections.
+
+Builds a synthetic database, then starts each server in turn and keeps
+``--connections`` keep-alive connections busy for ``--duration`` seconds
+with a mix of catalog reads and cart writes, reporting throughput, tail
+latency and failed requests per server:
+
+    python benchmarks/concurrency.py
+    python benchmarks/concurrency.py --connections 1000 --workers 4 --output concurrency.json
+
+Latency is measured by the client, so it includes waiting for a connection
+the server has not accepted yet.
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark import app, build_dataset, percentile, start_gunicorn, start_server  # noqa: E402
+import benchmark  # noqa: E402
+
+
+def start_uvicorn(database, workers):
+    return start_server(
+        'uvicorn',
+        [
+            'uvicorn',
+            '--host', '127.0.0.1',
+            '--port', '{port}',
+            '--workers', str(workers),
+            '--log-level', 'warning',
+            '--no-access-log',
+            'asgi:app'
+        ],
+        database
+    )
+
+
+def session_cookie(username):
+    """Sign a session for ``username`` the way /auth/login would, without hashing a password per user."""
+    with app.app_context():
+        value = app.session_interface.get_signing_serializer(app).dumps({'username': username})
+
+    return f'{app.session_cookie_name}={value}'
+
+
+def next_request(rng, product_ids, write_ratio):
+    if rng.random() < write_ratio:
+        body = json.dumps({'products': [{'product_id': rng.choice(product_ids), 'quantity': 1}]})
+        return 'POST', '/shopping-cart/add-to-cart', body
+
+    path = rng.choice([
+        f'/products/product-details/{rng.choice(product_ids)}',
+        '/products/all-products?limit=50',
+        '/shopping-cart/get-products-in-cart',
+    ])
+    return 'GET', path, None
+
+
+async def read_response(reader):
+    status_line = await reader.readline()
+
+    if not status_line:
+        raise ConnectionError('Connection closed before a response.')
+
+    status = int(status_line.split()[1])
+    headers = {}
+
+    while True:
+        line = await reader.readline()
+
+        if line in (b'\r\n', b''):
+            break
+
+        name, _, value = line.decode('latin1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, headers.get('connection', '').lower() == 'close'
+
+
+async def connection(port, cookie, rng, product_ids, write_ratio, deadline, samples, failures):
+    reader = writer = None
+
+    while time.monotonic() < deadline:
+        method, path, body = next_request(rng, product_ids, write_ratio)
+        request = f'{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: {cookie}\r\n'
+
+        if body is not None:
+            request += f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n{body}'
+        else:
+            request += '\r\n'
+
+        started_at = time.monotonic()
+
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+
+            writer.write(request.encode('utf8'))
+            status, close = await read_response(reader)
+        except (OSError, ConnectionError, asyncio.IncompleteReadError):
+            failures['connection'] += 1
+
+            if writer is not None:
+                writer.close()
+
+            reader = writer = None
+            await asyncio.sleep(0.05)
+            continue
+
+        samples.append(time.monotonic() - started_at)
+
+        if status != 200:
+            failures[str(status)] = failures.get(str(status), 0) + 1
+
+        if close:
+            writer.close()
+            reader = writer = None
+
+    if writer is not None:
+        writer.close()
+
+
+async def load(port, connections, users, product_ids, write_ratio, duration, seed):
+    cookies = [session_cookie(f'bench-user-{index}') for index in range(users)]
+    deadline = time.monotonic() + duration
+    samples = []
+    failures = {'connection': 0}
+
+    started_at = time.monotonic()
+    await asyncio.gather(*[
+        connection(port, cookies[index % users], random.Random(seed + index), product_ids, write_ratio, deadline, samples, failures)
+        for index in range(connections)
+    ])
+    elapsed = time.monotonic() - started_at
+
+    samples.sort()
+
+    return {
+        'requests': len(samples),
+        'failures': failures,
+        'throughput_rps': round(len(samples) / elapsed, 1),
+        'p50_ms': round(percentile(samples, 0.50) * 1000, 1),
+        'p95_ms': round(percentile(samples, 0.95) * 1000, 1),
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 1),
+        'max_ms': round(samples[-1] * 1000, 1),
+    }
+
+
+@click.command()
+@click.option('--connections', default=500, show_default=True, help='Connections kept open at once.')
+@click.option('--duration', default=20.0, show_default=True, help='Seconds of load per server.')
+@click.option('--workers', default=2, show_default=True, help='Worker processes for either server.')
+@click.option('--write-ratio', default=0.1, show_default=True, help='Share of requests that add to a cart.')
+@click.option('--users', default=200, show_default=True)
+@click.option('--products', default=2000, show_default=True)
+@click.option('--orders', default=1000, show_default=True)
+@click.option('--seed', default=1, show_default=True)
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the results as JSON to this file.')
+def benchmark_concurrency(connections, duration, workers, write_ratio, users, products, orders, seed, output):
+    database = os.path.join(tempfile.mkdtemp(prefix='flaskr-concurrency-'), 'concurrency.sqlite')
+    click.echo(f'Building dataset in {database}...')
+    benchmark.user_count = users
+    product_ids = build_dataset(database, users=users, products=products, tags=50, carts=0, orders=orders, seed=seed)
+
+    servers = [
+        ('gunicorn sync', lambda: start_gunicorn(database, workers, 1)),
+        ('uvicorn asgi', lambda: start_uvicorn(database, workers)),
+    ]
+    results = {}
+
+    for name, start in servers:
+        server, port = start()
+
+        try:
+            results[name] = asyncio.run(load(port, connections, users, product_ids, write_ratio, duration, seed))
+        finally:
+            server.terminate()
+            server.wait()
+
+        result = results[name]
+        click.echo(
+            f'{name:<14} {result["throughput_rps"]:>8.1f} req/s  p50 {result["p50_ms"]:>8.1f}ms  p95 {result["p95_ms"]:>8.1f}ms  '
+            f'p99 {result["p99_ms"]:>8.1f}ms  max {result["max_ms"]:>8.1f}ms  failures {result["failures"]}'
+        )
+
+    if output:
+        with open(output, 'w', encoding='utf8') as f:
+            json.dump({'connections': connections, 'duration': duration, 'workers': workers, 'write_ratio': write_ratio, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    benchmark_concurrency()
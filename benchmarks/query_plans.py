@@ -0,0 +1,156 @@
+"""Fail when any query the blueprints run reads a whole table or index.
+
+Every benchmark route is called once against a small synthetic database
+while the SQL it runs is captured. Each distinct statement is then passed
+through ``EXPLAIN QUERY PLAN``, and the script exits non-zero when a plan
+scans a table, or walks a whole index, that is not allowed below:
+
+    python benchmarks/query_plans.py
+    python benchmarks/query_plans.py --verbose
+
+tests/test_query_plans.py runs the same check under pytest, which is how CI
+runs it.
+"""
+import os
+import re
+import sys
+import tempfile
+
+import click
+from flask import g, request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark import ROUTES, ClientSession, Context, app, build_dataset  # noqa: E402
+import benchmark  # noqa: E402
+from flaskr.db import get_db  # noqa: E402
+
+# Reading a whole table is the point of these statements, and the tables
+# stay small: one row per shipper, day or category.
+ALLOWED_SCANS = {
+    'shipper',
+    'sales_by_day',
+    'sales_by_category',
+    'sales_by_shipper',
+}
+
+# Index walks allowed to cover a whole index, as (endpoint, table, index).
+# Each one either stops at its LIMIT or belongs to an endpoint that returns
+# every row anyway.
+ALLOWED_INDEX_SCANS = {
+    # Customer all-products pages through in-stock products by total_sold.
+    ('products.all_products', 'product', 'product_in_stock_total_sold'),
+    # Top products by revenue or units stop at their LIMIT.
+    ('analytics.top_products', 'sales_by_product', 'sales_by_product_revenue'),
+    ('analytics.top_products', 'sales_by_product', 'sales_by_product_units'),
+    # get-all-customers-orders returns every order, in order_id order.
+    ('orders.get_all_customers_orders', 'order_info', 'sqlite_autoindex_order_info_1'),
+}
+
+# ``SCAN <table>`` reads the table; ``SCAN <table> USING [COVERING] INDEX
+# <index>`` walks all of the index. Plans that SEARCH are bounded.
+SCAN = re.compile(r'^SCAN (\w+)(?: USING (?:COVERING )?INDEX (\w+))?$')
+
+
+def explain(db, sql):
+    names = re.findall(r':(\w+)', sql)
+    parameters = dict.fromkeys(names) if names else (None,) * sql.count('?')
+    return [row['detail'] for row in db.execute('EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()]
+
+
+def full_scans(sql, endpoint, plan):
+    # Plans name tables by their alias in the statement.
+    tables = {alias: table for table, alias in re.findall(r'(?:FROM|JOIN) (\w+) AS (\w+)', sql)}
+    scans = []
+
+    for detail in plan:
+        match = SCAN.match(detail)
+
+        if match is None:
+            continue
+
+        table, index = tables.get(match.group(1), match.group(1)), match.group(2)
+
+        if index is None and table not in ALLOWED_SCANS:
+            scans.append(detail)
+        elif index is not None and (endpoint, table, index) not in ALLOWED_INDEX_SCANS:
+            scans.append(detail)
+
+    return scans
+
+
+def collect_statements():
+    """Call every benchmark route once and return each distinct statement with its endpoint."""
+    database = os.path.join(tempfile.mkdtemp(prefix='flaskr-query-plans-'), 'query-plans.sqlite')
+    benchmark.user_count = 20
+    product_ids = build_dataset(database, users=20, products=200, tags=10, carts=5, orders=100, seed=1)
+
+    statements = {}
+
+    def collect(exception=None):
+        for stats in g.get('sql_statements', []):
+            statements.setdefault(' '.join(stats.sql.split()), g.get('endpoint_name'))
+
+    def name_endpoint():
+        g.endpoint_name = request.endpoint
+
+    instrumentation = app.config['INSTRUMENTATION']
+    app.config['INSTRUMENTATION'] = True
+    app.before_request(name_endpoint)
+    app.teardown_request(collect)
+
+    try:
+        ctx = Context(ClientSession, 0, product_ids, seed=1)
+
+        for _, _, prepare in ROUTES:
+            session, method, path, body = prepare(ctx)
+            session.request(method, path, body)
+    finally:
+        app.config['INSTRUMENTATION'] = instrumentation
+        app.before_request_funcs[None].remove(name_endpoint)
+        app.teardown_request_funcs[None].remove(collect)
+
+    return statements
+
+
+def check_plans(statements):
+    """Return ``(sql, endpoint, plan, scans)`` for every statement, scans listing the disallowed steps."""
+    results = []
+
+    with app.app_context():
+        db = get_db()
+
+        for sql, endpoint in sorted(statements.items(), key=lambda item: (item[1] or '', item[0])):
+            if not re.match(r'(SELECT|INSERT|UPDATE|DELETE|WITH)\b', sql, re.IGNORECASE):
+                continue
+
+            plan = explain(db, sql)
+            results.append((sql, endpoint, plan, full_scans(sql, endpoint, plan)))
+
+    return results
+
+
+@click.command()
+@click.option('--verbose', is_flag=True, help='Print the plan of every statement.')
+def check_query_plans(verbose):
+    results = check_plans(collect_statements())
+    failures = 0
+
+    for sql, endpoint, plan, scans in results:
+        if scans:
+            failures += 1
+
+        if scans or verbose:
+            click.echo(f'{"FULL SCAN" if scans else "ok"} [{endpoint}] {sql}')
+
+            for detail in plan:
+                click.echo(f'    {detail}')
+
+    click.echo(f'{len(results)} statements checked, {failures} with full table or index scans.')
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    check_query_plans()
@@ -0,0 +1,110 @@
+"""Compare product search through the FTS5 index with the LIKE query it replaced.
+
+Builds a synthetic catalog, then runs each search term through the old
+LIKE scan, kept here as the baseline, and through ``search_catalog``, for
+the first page and for every match, reporting median latency and rows
+returned:
+
+    python benchmarks/search.py
+    python benchmarks/search.py --products 20000 --repeat 10 --output search.json
+
+The LIKE query matches substrings and the FTS5 one token prefixes, so the
+number of matches can differ slightly for the same term.
+"""
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark import build_dataset  # noqa: E402
+from flaskr.pagination import sql_limit  # noqa: E402
+from flaskr.products import search_catalog  # noqa: E402
+
+CUSTOMER_COLUMNS = 'product_id, product_name, description, product_category, price, discount'
+
+TERMS = ['lamp', 'wireless lamp', '4242', 'kitchen', 'nothing matches']
+
+
+def search_like(db, term, limit):
+    """The customer search-products query before the FTS5 index."""
+    search_term_formatted = '%' + term.replace(' ', '%') + '%'
+
+    return db.execute(
+        f'SELECT {CUSTOMER_COLUMNS} FROM product '
+        'WHERE product_id > ? AND ('
+        '    LOWER(product_name) LIKE ? OR LOWER(description) LIKE ? OR LOWER(product_category) LIKE ? OR '
+        '    product_id IN ('
+        '        SELECT product_id FROM product_by_tag WHERE tag_name LIKE ?'
+        '    )'
+        ') '
+        'ORDER BY product_id ASC '
+        'LIMIT ?',
+        ('', search_term_formatted, search_term_formatted, search_term_formatted, search_term_formatted, sql_limit(limit))
+    ).fetchall()
+
+
+def search_fts(db, term, limit):
+    match_query = ' '.join(f'"{word}"*' for word in re.findall(r'\w+', term.lower()))
+    return search_catalog(db, ', '.join('p.' + column for column in CUSTOMER_COLUMNS.split(', ')), match_query, limit, None)
+
+
+def time_search(db, search, term, limit, repeat):
+    rows = search(db, term, limit)
+    samples = []
+
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        search(db, term, limit)
+        samples.append(time.perf_counter() - started_at)
+
+    samples.sort()
+    return {'rows': len(rows), 'median_ms': round(samples[len(samples) // 2] * 1000, 2)}
+
+
+@click.command()
+@click.option('--products', default=100000, show_default=True)
+@click.option('--tags', default=50, show_default=True)
+@click.option('--page-size', default=20, show_default=True, help='Limit of the first-page searches.')
+@click.option('--repeat', default=5, show_default=True, help='Timed searches per term, query and limit.')
+@click.option('--seed', default=1, show_default=True)
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the results as JSON to this file.')
+def benchmark_search(products, tags, page_size, repeat, seed, output):
+    database = os.path.join(tempfile.mkdtemp(prefix='flaskr-search-'), 'search.sqlite')
+    click.echo(f'Building a catalog of {products} products in {database}...')
+    build_dataset(database, users=1, products=products, tags=tags, carts=0, orders=0, seed=seed)
+
+    db = sqlite3.connect(database)
+    db.row_factory = sqlite3.Row
+    results = {}
+
+    click.echo(f'{"term":<18} {"limit":>6} {"LIKE rows":>10} {"LIKE ms":>10} {"FTS5 rows":>10} {"FTS5 ms":>10} {"speedup":>8}')
+
+    try:
+        for term in TERMS:
+            for limit in (page_size, None):
+                like = time_search(db, search_like, term, limit, repeat)
+                fts = time_search(db, search_fts, term, limit, repeat)
+                results.setdefault(term, {})['all' if limit is None else str(limit)] = {'like': like, 'fts5': fts}
+
+                speedup = f'{like["median_ms"] / fts["median_ms"]:.1f}x' if fts['median_ms'] else '-'
+                click.echo(
+                    f'{term:<18} {limit or "all":>6} {like["rows"]:>10} {like["median_ms"]:>10.2f} '
+                    f'{fts["rows"]:>10} {fts["median_ms"]:>10.2f} {speedup:>8}'
+                )
+    finally:
+        db.close()
+
+    if output:
+        with open(output, 'w', encoding='utf8') as f:
+            json.dump({'products': products, 'page_size': page_size, 'repeat': repeat, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    benchmark_search()
@@ -0,0 +1,72 @@
+"""Compare the JSON backends on the largest responses the API builds.
+
+Builds a synthetic database, then times the unpaginated product listings
+and order histories once per JSON_BACKEND through the Flask test client:
+
+    python benchmarks/serialization.py
+    python benchmarks/serialization.py --products 50000 --orders 20000 --output serialization.json
+"""
+import json
+import os
+import sys
+import tempfile
+
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark import ClientSession, Context, app, build_dataset, measure  # noqa: E402
+import benchmark  # noqa: E402
+from flaskr import serialization  # noqa: E402
+
+RESPONSES = [
+    ('all-products admin', lambda ctx: (ctx.admin, 'GET', '/products/all-products', None)),
+    ('all-products customer', lambda ctx: (ctx.customer, 'GET', '/products/all-products', None)),
+    ('get-all-orders', lambda ctx: (ctx.customer, 'GET', '/orders/get-all-orders', None)),
+    ('get-all-customers-orders', lambda ctx: (ctx.admin, 'GET', '/orders/get-all-customers-orders', None)),
+]
+
+
+@click.command()
+@click.option('--users', default=20, show_default=True, help='Fewer users give each one a longer order history.')
+@click.option('--products', default=20000, show_default=True)
+@click.option('--orders', default=5000, show_default=True)
+@click.option('--requests', default=20, show_default=True, help='Timed requests per response and backend.')
+@click.option('--warmup', default=2, show_default=True)
+@click.option('--seed', default=1, show_default=True)
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the results as JSON to this file.')
+def benchmark_serialization(users, products, orders, requests, warmup, seed, output):
+    database = os.path.join(tempfile.mkdtemp(prefix='flaskr-serialization-'), 'serialization.sqlite')
+    click.echo(f'Building dataset in {database}...')
+    benchmark.user_count = users
+    product_ids = build_dataset(database, users=users, products=products, tags=50, carts=0, orders=orders, seed=seed)
+
+    backends = ['json'] + (['orjson'] if serialization.orjson is not None else [])
+    results = {}
+
+    for backend in backends:
+        app.config['JSON_BACKEND'] = backend
+        serialization.init_app(app)
+        ctx = Context(ClientSession, 0, product_ids, seed)
+
+        for name, prepare in RESPONSES:
+            session, method, path, body = prepare(ctx)
+            _, data = session.request(method, path, body)
+            result = measure([ctx], prepare, requests, warmup)
+            result['response_bytes'] = len(data)
+            results.setdefault(name, {})[backend] = result
+
+    click.echo(f'{"response":<26} {"bytes":>10} ' + ' '.join(f'{backend + " p50 ms":>14}' for backend in backends) + f' {"speedup":>8}')
+
+    for name, by_backend in results.items():
+        p50s = [by_backend[backend]['p50_ms'] for backend in backends]
+        speedup = f'{p50s[0] / p50s[-1]:.2f}x' if len(p50s) > 1 else '-'
+        click.echo(f'{name:<26} {by_backend["json"]["response_bytes"]:>10} ' + ' '.join(f'{p50:>14.1f}' for p50 in p50s) + f' {speedup:>8}')
+
+    if output:
+        with open(output, 'w', encoding='utf8') as f:
+            json.dump({'backends': backends, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    benchmark_serialization()
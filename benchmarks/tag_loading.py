@@ -0,0 +1,109 @@
+"""Compare loading listing tags one product at a time with the batched loader.
+
+Builds a synthetic catalog per ``--sizes`` entry, then loads the tags of
+every product both the way all-products used to, with one query per
+product, and through ``get_tags_by_product``, which asks for them in
+chunks. Reports statements run and latency for each, and fails if the two
+disagree:
+
+    python benchmarks/tag_loading.py
+    python benchmarks/tag_loading.py --sizes 1000,10000 --repeat 5 --output tag_loading.json
+"""
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark import build_dataset  # noqa: E402
+from flaskr.products import get_tags_by_product  # noqa: E402
+
+
+def get_tags_per_product(db, product_ids):
+    """The all-products tag loop before it was batched."""
+    tags_by_product = {}
+
+    for product_id in product_ids:
+        get_product_tags = db.execute(
+            'SELECT tag_name FROM product_by_tag '
+            'WHERE product_id = ?',
+            (product_id,)
+        ).fetchall()
+
+        tags_by_product[product_id] = [tag['tag_name'] for tag in get_product_tags]
+
+    return tags_by_product
+
+
+def time_loader(db, load, product_ids, repeat):
+    statements = []
+    db.set_trace_callback(statements.append)
+
+    try:
+        tags_by_product = load(db, product_ids)
+    finally:
+        db.set_trace_callback(None)
+
+    samples = []
+
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        load(db, product_ids)
+        samples.append(time.perf_counter() - started_at)
+
+    samples.sort()
+    result = {
+        'queries': len(statements),
+        'median_ms': round(samples[len(samples) // 2] * 1000, 1),
+        'min_ms': round(samples[0] * 1000, 1),
+    }
+    return result, tags_by_product
+
+
+@click.command()
+@click.option('--sizes', default='1000,10000,100000', show_default=True, help='Comma separated catalog sizes.')
+@click.option('--tags', default=50, show_default=True, help='Distinct tags in each catalog.')
+@click.option('--repeat', default=3, show_default=True, help='Timed loads per loader and size.')
+@click.option('--seed', default=1, show_default=True)
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the results as JSON to this file.')
+def benchmark_tag_loading(sizes, tags, repeat, seed, output):
+    loaders = [('per product', get_tags_per_product), ('batched', get_tags_by_product)]
+    results = {}
+
+    click.echo(f'{"products":>9} {"loader":<12} {"queries":>8} {"median ms":>10} {"min ms":>10}')
+
+    for size in [int(size) for size in sizes.split(',')]:
+        database = os.path.join(tempfile.mkdtemp(prefix='flaskr-tag-loading-'), 'tag-loading.sqlite')
+        build_dataset(database, users=1, products=size, tags=tags, carts=0, orders=0, seed=seed)
+
+        db = sqlite3.connect(database)
+        db.row_factory = sqlite3.Row
+
+        try:
+            # all-products lists products by name, so the tags are asked for in that order.
+            product_ids = [row['product_id'] for row in db.execute('SELECT product_id FROM product ORDER BY product_name')]
+            loaded = []
+
+            for name, load in loaders:
+                result, tags_by_product = time_loader(db, load, product_ids, repeat)
+                results.setdefault(str(size), {})[name] = result
+                loaded.append({product_id: sorted(tags) for product_id, tags in tags_by_product.items()})
+                click.echo(f'{size:>9} {name:<12} {result["queries"]:>8} {result["median_ms"]:>10.1f} {result["min_ms"]:>10.1f}')
+        finally:
+            db.close()
+
+        if loaded[0] != loaded[1]:
+            raise click.ClickException(f'The loaders returned different tags for {size} products.')
+
+    if output:
+        with open(output, 'w', encoding='utf8') as f:
+            json.dump({'tags': tags, 'repeat': repeat, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    benchmark_tag_loading()
@@ -0,0 +1,217 @@
+from datetime import date, timedelta
+
+import click
+from flask import Blueprint, jsonify, request
+from flask.cli import with_appcontext
+
+from flaskr.auth import login_required, authorization_required
+from flaskr.db import get_db
+
+bp = Blueprint('analytics', __name__, url_prefix='/analytics')
+
+
+def record_order(db, created_at, order_lines):
+    """Add a placed order to the sales rollups, inside the checkout transaction.
+
+    ``order_lines`` are dicts with product_id, product_name,
+    product_category, quantity and line_total.
+    """
+    units = sum(line['quantity'] for line in order_lines)
+    revenue = sum(line['line_total'] for line in order_lines)
+
+    db.execute(
+        'INSERT INTO sales_by_day (day, orders, units, revenue) VALUES (?, 1, ?, ?) '
+        'ON CONFLICT(day) DO UPDATE SET orders = orders + 1, units = units + excluded.units, revenue = revenue + excluded.revenue',
+        (created_at.strftime('%Y-%m-%d'), units, revenue)
+    )
+
+    db.executemany(
+        'INSERT INTO sales_by_product (product_id, product_name, units, revenue) VALUES (?, ?, ?, ?) '
+        'ON CONFLICT(product_id) DO UPDATE SET product_name = excluded.product_name, units = units + excluded.units, revenue = revenue + excluded.revenue',
+        [(line['product_id'], line['product_name'], line['quantity'], line['line_total']) for line in order_lines]
+    )
+
+    categories = {}
+
+    for line in order_lines:
+        category_units, category_revenue = categories.get(line['product_category'], (0, 0))
+        categories[line['product_category']] = (category_units + line['quantity'], category_revenue + line['line_total'])
+
+    db.executemany(
+        'INSERT INTO sales_by_category (product_category, units, revenue) VALUES (?, ?, ?) '
+        'ON CONFLICT(product_category) DO UPDATE SET units = units + excluded.units, revenue = revenue + excluded.revenue',
+        [(category, category_units, category_revenue) for category, (category_units, category_revenue) in categories.items()]
+    )
+
+
+def record_shipment(db, shipper_id, orders, revenue):
+    """Add shipped orders to the shipper rollup, inside the shipment transaction."""
+    db.execute(
+        'INSERT INTO sales_by_shipper (shipper_id, orders, revenue) VALUES (?, ?, ?) '
+        'ON CONFLICT(shipper_id) DO UPDATE SET orders = orders + excluded.orders, revenue = revenue + excluded.revenue',
+        (shipper_id, orders, revenue)
+    )
+
+
+def rebuild_rollups(db):
+    """Recompute every rollup from order_info and order_lines in one transaction."""
+    with db:
+        db.execute('DELETE FROM sales_by_day')
+        db.execute('DELETE FROM sales_by_product')
+        db.execute('DELETE FROM sales_by_category')
+        db.execute('DELETE FROM sales_by_shipper')
+
+        db.execute(
+            'INSERT INTO sales_by_day (day, orders, units, revenue) '
+            'SELECT date(oi.created_at), COUNT(DISTINCT oi.order_id), SUM(ol.quantity), SUM(ol.line_total) FROM order_info AS oi '
+            'JOIN order_lines AS ol '
+            'ON ol.order_id = oi.order_id '
+            'GROUP BY date(oi.created_at)'
+        )
+
+        # The most recent name wins, as with incremental updates.
+        db.execute(
+            'INSERT INTO sales_by_product (product_id, product_name, units, revenue) '
+            'SELECT ol.product_id, '
+            '(SELECT latest.product_name FROM order_lines AS latest JOIN order_info AS latest_oi ON latest_oi.order_id = latest.order_id '
+            ' WHERE latest.product_id = ol.product_id ORDER BY latest_oi.created_at DESC LIMIT 1), '
+            'SUM(ol.quantity), SUM(ol.line_total) FROM order_lines AS ol '
+            'GROUP BY ol.product_id'
+        )
+
+        db.execute(
+            'INSERT INTO sales_by_category (product_category, units, revenue) '
+            'SELECT product_category, SUM(quantity), SUM(line_total) FROM order_lines '
+            'GROUP BY product_category'
+        )
+
+        db.execute(
+            'INSERT INTO sales_by_shipper (shipper_id, orders, revenue) '
+            'SELECT shipper_id, COUNT(*), SUM(order_total) FROM order_info '
+            'WHERE shipper_id IS NOT NULL '
+            'GROUP BY shipper_id'
+        )
+
+
+def get_limit(default):
+    limit = request.args.get('limit', default)
+
+    try:
+        limit = int(limit)
+    except ValueError:
+        return None
+
+    return limit if limit > 0 else None
+
+
+@bp.route('/revenue-by-day', methods=['GET'])
+@login_required
+@authorization_required
+def revenue_by_day():
+    response = {
+        'isSuccess': False,
+        'operation': 'Revenue by day'
+    }
+
+    days = request.args.get('days', '90')
+
+    if not days.isdigit() or int(days) < 1:
+        response['error'] = 'days should be a positive integer.'
+        return response
+
+    first_day = date.today() - timedelta(days=int(days) - 1)
+
+    db = get_db()
+    sales = db.execute(
+        'SELECT day, orders, units, revenue FROM sales_by_day '
+        'WHERE day >= ? '
+        'ORDER BY day ASC',
+        (first_day.isoformat(),)
+    ).fetchall()
+
+    return jsonify({
+        'isSuccess': True,
+        'total_revenue': round(sum(day['revenue'] for day in sales), 2),
+        'days': sales
+    })
+
+
+@bp.route('/top-products', methods=['GET'])
+@login_required
+@authorization_required
+def top_products():
+    response = {
+        'isSuccess': False,
+        'operation': 'Top products'
+    }
+
+    limit = get_limit(50)
+
+    if limit is None:
+        response['error'] = 'limit should be a positive integer.'
+        return response
+
+    order_by = request.args.get('by', 'revenue')
+
+    if order_by not in ['revenue', 'units']:
+        response['error'] = 'by should be revenue or units.'
+        return response
+
+    db = get_db()
+    sales = db.execute(
+        'SELECT product_id, product_name, units, revenue FROM sales_by_product '
+        f'ORDER BY {order_by} DESC '
+        'LIMIT ?',
+        (limit,)
+    ).fetchall()
+
+    return jsonify({
+        'isSuccess': True,
+        'products': sales
+    })
+
+
+@bp.route('/revenue-by-category', methods=['GET'])
+@login_required
+@authorization_required
+def revenue_by_category():
+    db = get_db()
+    sales = db.execute(
+        'SELECT product_category, units, revenue FROM sales_by_category '
+        'ORDER BY revenue DESC'
+    ).fetchall()
+
+    return jsonify({
+        'isSuccess': True,
+        'categories': sales
+    })
+
+
+@bp.route('/revenue-by-shipper', methods=['GET'])
+@login_required
+@authorization_required
+def revenue_by_shipper():
+    db = get_db()
+    sales = db.execute(
+        'SELECT sbs.shipper_id, s.shipper_name, sbs.orders, sbs.revenue FROM sales_by_shipper AS sbs '
+        'LEFT JOIN shipper AS s '
+        'ON s.shipper_id = sbs.shipper_id '
+        'ORDER BY sbs.revenue DESC'
+    ).fetchall()
+
+    return jsonify({
+        'isSuccess': True,
+        'shippers': sales
+    })
+
+
+@click.command('rebuild-analytics')
+@with_appcontext
+def rebuild_analytics_command():
+    """Recompute the sales rollups from the order history."""
+    rebuild_rollups(get_db())
+    click.echo('Rebuilt the sales rollups.')
+
+
+def init_app(app):
+    app.cli.add_command(rebuild_analytics_command)
@@ -0,0 +1,215 @@
+import asyncio
+import io
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+
+def build_environ(scope, body):
+    """Translate an ASGI HTTP scope and its request body into a WSGI environ."""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        # WSGI carries paths as latin-1 decoded bytes.
+        'SCRIPT_NAME': root_path.encode('utf8').decode('latin1'),
+        'PATH_INFO': path.encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+
+    for name, value in scope['headers']:
+        name = name.decode('latin1')
+
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+
+        value = value.decode('latin1')
+
+        if key in environ:
+            value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+
+        environ[key] = value
+
+    return environ
+
+
+class ASGIApp:
+    """Serves the WSGI app to an ASGI server, running requests on a bounded thread pool.
+
+    The event loop holds every open connection, so slow clients and idle
+    keep-alive connections do not tie up a thread. At most
+    ASGI_MAX_CONCURRENCY requests are handed to the app at once, on
+    ASGI_THREADS threads, and a request that waits longer than
+    ASGI_QUEUE_TIMEOUT seconds for its turn is answered with 503.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.executor = None
+        self.semaphore = None
+
+    def start(self):
+        if self.executor is None:
+            # Every pool thread holds a database connection while it serves a
+            # request, so the connection pool needs one per thread.
+            self.app.config['DATABASE_POOL_SIZE'] = max(self.app.config['DATABASE_POOL_SIZE'], self.app.config['ASGI_THREADS'])
+            pool = self.app.extensions.pop('db_pool', None)
+
+            if pool is not None:
+                pool.close()
+
+            self.executor = ThreadPoolExecutor(max_workers=self.app.config['ASGI_THREADS'], thread_name_prefix='flaskr-asgi')
+            self.semaphore = asyncio.Semaphore(self.app.config['ASGI_MAX_CONCURRENCY'])
+
+    def stop(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+
+        if scope['type'] != 'http':
+            raise ValueError(f'Unsupported ASGI scope type {scope["type"]!r}.')
+
+        self.start()
+        body = await read_body(receive)
+
+        if body is None:
+            return
+
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.app.config['ASGI_QUEUE_TIMEOUT'])
+        except asyncio.TimeoutError:
+            await send_busy(send)
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, self.run_wsgi, build_environ(scope, body), send, loop)
+        finally:
+            self.semaphore.release()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+
+            if message['type'] == 'lifespan.startup':
+                self.start()
+                await send({'type': 'lifespan.startup.complete'})
+
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.get_running_loop().run_in_executor(None, self.stop)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def run_wsgi(self, environ, send, loop):
+        """Call the WSGI app on a pool thread, sending its response through the event loop.
+
+        Each chunk is held back until the next one is known, so the last
+        chunk goes out with ``more_body`` unset and a buffered response,
+        together with its start message, costs one hop to the event loop.
+        Each hop waits until the server took the messages, so a streamed
+        response is produced no faster than the client reads it.
+        """
+        def call_send(*messages):
+            async def send_all():
+                for message in messages:
+                    await send(message)
+
+            asyncio.run_coroutine_threadsafe(send_all(), loop).result()
+
+        response_start = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info is not None and response_start.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+
+            response_start['message'] = {
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers],
+            }
+
+        def send_body(body, more_body):
+            message = {'type': 'http.response.body', 'body': body, 'more_body': more_body}
+
+            if response_start.get('sent'):
+                call_send(message)
+            else:
+                call_send(response_start['message'], message)
+                response_start['sent'] = True
+
+        iterable = self.app(environ, start_response)
+
+        try:
+            previous = b''
+
+            for chunk in iterable:
+                if chunk:
+                    if previous:
+                        send_body(previous, True)
+
+                    previous = chunk
+
+            send_body(previous, False)
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+
+
+async def read_body(receive):
+    """Return the request body, or None when the client disconnected before sending all of it."""
+    body = []
+
+    while True:
+        message = await receive()
+
+        if message['type'] == 'http.disconnect':
+            return None
+
+        body.append(message.get('body', b''))
+
+        if not message.get('more_body'):
+            break
+
+    return b''.join(body)
+
+
+async def send_busy(send):
+    body = json.dumps({'isSuccess': False, 'message': 'Server busy, try again.'}).encode('utf8')
+
+    await send({
+        'type': 'http.response.start',
+        'status': 503,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode('ascii')),
+            (b'retry-after', b'1'),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
@@ -4,10 +4,14 @@ from datetime import datetime
 from flask import Blueprint, g, request, session
 from werkzeug.security import check_password_hash, generate_password_hash
 
+from flaskr.cache import TTLCache
 from flaskr.db import get_db
 
 bp = Blueprint('auth', __name__, url_prefix='/auth')
 
+# Logged in users by username, so a request costs at most one user lookup.
+user_cache = TTLCache(maxsize=4096, ttl=60)
+
 
 def login_required(view):
     @functools.wraps(view)
@@ -116,6 +120,7 @@ def grant_admin_permission():
             ('admin', username)
         )
         db.commit()
+        user_cache.delete(username)
 
     response['isSuccess'] = True
     return response
@@ -158,6 +163,7 @@ def login():
 
     session.clear()
     session['username'] = user['username']
+    user_cache.set(user['username'], dict(user))
     response['isSuccess'] = True
     return response
 
@@ -168,11 +174,19 @@ def load_logged_in_user():
 
     if username is None:
         g.user = None
-    else:
-        g.user = get_db().execute(
+        return
+
+    g.user = user_cache.get(username)
+
+    if g.user is None:
+        user = get_db().execute(
             'SELECT * FROM user WHERE username = ?', (username,)
         ).fetchone()
 
+        if user is not None:
+            g.user = dict(user)
+            user_cache.set(username, g.user)
+
 
 @bp.route('/logout', methods=['POST'])
 def logout():
@@ -197,11 +211,7 @@ def delete_account():
     username = g.user['username']
     password = body['password']
 
-    user = db.execute(
-        'SELECT * FROM user WHERE username = ?', (username,)
-    ).fetchone()
-
-    if not check_password_hash(user['password'], password):
+    if not check_password_hash(g.user['password'], password):
         response['error'] = 'Incorrect password.'
         return response
 
@@ -211,6 +221,7 @@ def delete_account():
         (username,)
     )
     db.commit()
+    user_cache.delete(username)
 
     response['isSuccess'] = True
     return response
@@ -0,0 +1,210 @@
+import json
+import threading
+import uuid
+
+from flask import current_app
+
+from flaskr.cache import TTLCache
+
+MISSING = object()
+
+
+class NullBackend:
+    """Caches nothing; used when CATALOG_CACHE_BACKEND is None."""
+
+    evictions = 0
+
+    def get(self, key, default=None):
+        return default
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+
+class RedisBackend:
+    """Keeps entries in a Redis server shared by every worker process.
+
+    Values are stored as JSON, so only JSON compatible values can be cached.
+    Tests can point CATALOG_CACHE_URL at a local stand-in server.
+    """
+
+    def __init__(self, url, ttl, prefix='flaskr:catalog:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('CATALOG_CACHE_BACKEND = "redis" needs the redis package, install flaskr[redis].')
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @property
+    def evictions(self):
+        return self.client.info('stats')['evicted_keys']
+
+    def get(self, key, default=None):
+        value = self.client.get(self.prefix + key)
+        return default if value is None else json.loads(value)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+class CatalogCache:
+    """Read-through cache for catalog reads, invalidated by catalog writes.
+
+    Single products and tag lists are cached under their product id and
+    deleted when that product is written. Listing and search pages live
+    under a shared version token that every catalog write replaces, so one
+    write drops them all without enumerating keys. With the in-process
+    backend each worker keeps its own entries, and writes made by another
+    worker are seen once the entries expire, or sooner by the catalog
+    endpoints, which ``sync`` with the catalog revision.
+    """
+
+    def __init__(self, backend, per_process=False):
+        self.backend = backend
+        self.per_process = per_process
+        self.revision = None
+        self.change_seq = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _count(self, hits, misses):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def get(self, key, load):
+        value = self.backend.get(key, MISSING)
+
+        if value is MISSING:
+            self._count(0, 1)
+            value = load()
+            self.backend.set(key, value)
+        else:
+            self._count(1, 0)
+
+        return value
+
+    def get_many(self, prefix, ids, load):
+        """Return ``{id: value}``, calling ``load(missing_ids)`` once for the ids not cached."""
+        values = {}
+        missing_ids = []
+
+        for id in ids:
+            value = self.backend.get(prefix + id, MISSING)
+
+            if value is MISSING:
+                missing_ids.append(id)
+            else:
+                values[id] = value
+
+        self._count(len(values), len(missing_ids))
+
+        if missing_ids:
+            for id, value in load(missing_ids).items():
+                self.backend.set(prefix + id, value)
+                values[id] = value
+
+        return values
+
+    def listing_key(self, *parts):
+        # Read the version before querying, so a page loaded while a write
+        # commits is stored under the version that write replaces.
+        version = self.backend.get('listing_version')
+
+        if version is None:
+            version = self.new_listing_version()
+
+        return f'listing:{version}:' + json.dumps(parts, default=str)
+
+    def new_listing_version(self):
+        version = uuid.uuid4().hex
+        self.backend.set('listing_version', version)
+        return version
+
+    def invalidate(self, product_ids=()):
+        """Forget the given products and every listing page, after a catalog write commits."""
+        for product_id in product_ids:
+            self.backend.delete('product:' + product_id)
+            self.backend.delete('tags:' + product_id)
+
+        self.new_listing_version()
+
+    def sync(self, db, revision):
+        """Catch a per-process cache up with writes other workers made.
+
+        Once a request sees a newer catalog revision, the listing pages are
+        dropped and the products named in ``product_change`` since the last
+        sync are forgotten; the rest stay cached. Stock updates that leave a
+        product in stock, as most checkouts do, name no product.
+        """
+        if not self.per_process or revision == self.revision:
+            return
+
+        with self._lock:
+            if revision == self.revision:
+                return
+
+            changes = db.execute(
+                'SELECT seq, product_id FROM product_change '
+                'WHERE seq > ? '
+                'ORDER BY seq ASC',
+                (self.change_seq or 0,)
+            ).fetchall()
+
+            # Without a starting point, or with changes pruned before this
+            # worker read them, it cannot tell which products are stale.
+            if self.change_seq is None or (changes and changes[0]['seq'] != self.change_seq + 1):
+                self.backend.clear()
+            else:
+                for change in changes:
+                    self.backend.delete('product:' + change['product_id'])
+                    self.backend.delete('tags:' + change['product_id'])
+
+                self.new_listing_version()
+
+            if changes:
+                self.change_seq = changes[-1]['seq']
+            elif self.change_seq is None:
+                self.change_seq = 0
+
+            self.revision = revision
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.backend.evictions}
+
+
+def get_catalog_cache():
+    catalog_cache = current_app.extensions.get('catalog_cache')
+
+    if catalog_cache is None:
+        backend = current_app.config['CATALOG_CACHE_BACKEND']
+
+        if backend == 'local':
+            backend = TTLCache(maxsize=current_app.config['CATALOG_CACHE_MAXSIZE'], ttl=current_app.config['CATALOG_CACHE_TTL'])
+        elif backend == 'redis':
+            backend = RedisBackend(current_app.config['CATALOG_CACHE_URL'], current_app.config['CATALOG_CACHE_TTL'])
+        elif backend is None:
+            backend = NullBackend()
+        else:
+            raise RuntimeError(f'Unknown CATALOG_CACHE_BACKEND {backend!r}.')
+
+        catalog_cache = current_app.extensions.setdefault('catalog_cache', CatalogCache(backend, per_process=isinstance(backend, TTLCache)))
+
+    return catalog_cache
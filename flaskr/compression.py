@@ -0,0 +1,126 @@
+import gzip
+
+from flask import current_app, make_response, request
+
+from flaskr.cache import TTLCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def get_encodings():
+    """Return the content encodings this process can produce, preferred first."""
+    return (['br'] if brotli is not None else []) + ['gzip']
+
+
+def choose_encoding():
+    """Return the preferred encoding the client accepts, or None."""
+    for encoding in get_encodings():
+        if request.accept_encodings[encoding]:
+            return encoding
+
+    return None
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=current_app.config['COMPRESSION_BROTLI_QUALITY'])
+
+    # A fixed mtime keeps the output, and so the variant's ETag, stable.
+    return gzip.compress(data, compresslevel=current_app.config['COMPRESSION_GZIP_LEVEL'], mtime=0)
+
+
+def compress_response(response):
+    """Compress responses of an allowed type that are at least COMPRESSION_MIN_SIZE bytes.
+
+    Bodies a snapshot already compressed are reused. A strong ETag gets the
+    encoding appended, since the compressed bytes are a different
+    representation.
+    """
+    if not current_app.config['COMPRESSION_ENABLED']:
+        return response
+
+    # A 304 has to vary like the 200 it stands for.
+    if response.status_code == 304:
+        response.vary.add('Accept-Encoding')
+        return response
+
+    if (
+        response.status_code < 200
+        or response.status_code in (204, 206)
+        or response.is_streamed
+        or response.direct_passthrough
+        or 'Content-Encoding' in response.headers
+        or response.mimetype not in current_app.config['COMPRESSION_MIMETYPES']
+    ):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding()
+
+    if encoding is None or len(response.get_data()) < current_app.config['COMPRESSION_MIN_SIZE']:
+        return response
+
+    precompressed = getattr(response, 'precompressed', {})
+
+    if encoding in precompressed:
+        response.set_data(precompressed[encoding])
+    else:
+        response.set_data(compress(response.get_data(), encoding))
+
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+
+    if etag is not None and not weak:
+        response.set_etag(f'{etag}-{encoding}')
+
+    return response
+
+
+def get_snapshots():
+    snapshots = current_app.extensions.get('response_snapshots')
+
+    if snapshots is None:
+        snapshots = current_app.extensions.setdefault(
+            'response_snapshots',
+            TTLCache(maxsize=current_app.config['SNAPSHOT_MAXSIZE'], ttl=current_app.config['SNAPSHOT_TTL'])
+        )
+
+    return snapshots
+
+
+def snapshot(key, build):
+    """Return the response ``build()`` makes, reusing it while ``key`` stays the same.
+
+    The body is kept together with every compressed variant, so repeated
+    responses cost neither the view nor compression. ``key`` has to change
+    whenever the response would.
+    """
+    snapshots = get_snapshots()
+    entry = snapshots.get(key)
+
+    if entry is None:
+        response = make_response(build())
+
+        if response.status_code != 200 or response.is_streamed:
+            return response
+
+        data = response.get_data()
+        precompressed = {}
+
+        if current_app.config['COMPRESSION_ENABLED'] and len(data) >= current_app.config['COMPRESSION_MIN_SIZE']:
+            precompressed = {encoding: compress(data, encoding) for encoding in get_encodings()}
+
+        entry = (data, response.mimetype, precompressed)
+        snapshots.set(key, entry)
+
+    data, mimetype, precompressed = entry
+    response = current_app.response_class(data, mimetype=mimetype)
+    response.precompressed = precompressed
+    return response
+
+
+def init_app(app):
+    app.after_request(compress_response)
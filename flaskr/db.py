@@ -1,34 +1,173 @@
+import json
+import os
+import queue
+import random
 import sqlite3
+import threading
+import time
+from datetime import datetime
 
 import click
 from flask import current_app, g
 from flask.cli import with_appcontext
 
+from flaskr.catalog_cache import get_catalog_cache
+from flaskr.instrumentation import instrument
+
+_pool_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """Keeps up to ``size`` configured SQLite connections open for reuse.
+
+    Requests beyond ``size`` get an extra connection that is closed when
+    released, so the pool never blocks. A size of 0 disables pooling.
+    """
+
+    def __init__(self, database, size, pragmas):
+        self.database = database
+        self.size = size
+        self.pragmas = pragmas
+        self.pid = os.getpid()
+        self._connections = queue.LifoQueue(maxsize=max(size, 1))
+
+    def connect(self):
+        db = sqlite3.connect(
+            self.database,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False
+        )
+        db.row_factory = sqlite3.Row
+
+        for name, value in self.pragmas.items():
+            db.execute(f'PRAGMA {name} = {value}')
+
+        return db
+
+    def acquire(self):
+        try:
+            return self._connections.get_nowait()
+        except queue.Empty:
+            return self.connect()
+
+    def release(self, db):
+        if db.in_transaction:
+            db.rollback()
+
+        if self.size == 0:
+            db.close()
+            return
+
+        try:
+            self._connections.put_nowait(db)
+        except queue.Full:
+            db.close()
+
+    def close(self):
+        while True:
+            try:
+                self._connections.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def get_pool():
+    pool = current_app.extensions.get('db_pool')
+
+    # A forked worker must not share its parent's connections.
+    if pool is None or pool.pid != os.getpid() or pool.database != current_app.config['DATABASE']:
+        with _pool_lock:
+            pool = current_app.extensions.get('db_pool')
+
+            if pool is None or pool.pid != os.getpid() or pool.database != current_app.config['DATABASE']:
+                if pool is not None and pool.pid == os.getpid():
+                    pool.close()
+
+                pool = ConnectionPool(
+                    current_app.config['DATABASE'],
+                    current_app.config['DATABASE_POOL_SIZE'],
+                    current_app.config['SQLITE_PRAGMAS']
+                )
+                current_app.extensions['db_pool'] = pool
+
+    return pool
+
 
 def get_db():
     if 'db' not in g:
-        g.db = sqlite3.connect(
-            current_app.config['DATABASE'],
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        g.db.row_factory = sqlite3.Row
+        g.db_connection = get_pool().acquire()
+        g.db = g.db_connection
+
+        if current_app.config['INSTRUMENTATION']:
+            g.db = instrument(g.db_connection)
 
     return g.db
 
 
+def run_in_transaction(work):
+    """Call ``work(db)`` inside ``BEGIN IMMEDIATE`` and commit its writes.
+
+    Taking the write lock up front means reads made by ``work`` cannot go
+    stale before its writes land. When another writer holds the lock the
+    transaction is retried with exponential backoff. Any exception raised by
+    ``work`` rolls the transaction back and propagates.
+    """
+    db = get_db()
+    retries = current_app.config['DATABASE_BUSY_RETRIES']
+    backoff = current_app.config['DATABASE_BUSY_BACKOFF']
+
+    if db.in_transaction:
+        db.commit()
+
+    for attempt in range(retries + 1):
+        try:
+            db.execute('BEGIN IMMEDIATE')
+            result = work(db)
+            db.commit()
+            return result
+
+        except sqlite3.OperationalError as error:
+            if db.in_transaction:
+                db.rollback()
+
+            if 'locked' not in str(error) or attempt == retries:
+                raise
+
+            time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+        except BaseException:
+            if db.in_transaction:
+                db.rollback()
+
+            raise
+
+
+def chunked(values, size=500):
+    values = list(values)
+
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
 def close_db(e=None):
-    db = g.pop('db', None)
+    g.pop('db', None)
+    db = g.pop('db_connection', None)
 
     if db is not None:
-        db.close()
+        get_pool().release(db)
 
 
 def init_db():
+    from flaskr.migrate import stamp
+
     db = get_db()
 
-    with current_app.open_resource('flaskr\\schema.sql') as f:
+    with current_app.open_resource('flaskr/schema.sql') as f:
         db.executescript(f.read().decode('utf8'))
 
+    # schema.sql already includes every migration.
+    stamp(db)
+
 
 @click.command('init-db')
 @with_appcontext
@@ -38,6 +177,143 @@ def init_db_command():
     click.echo('Initialized the database.')
 
 
+def iter_json_records(f, buffer_size=65536):
+    """Yield the objects of a JSON array or JSON lines file one at a time.
+
+    Only the record being decoded is buffered, so memory stays bounded
+    whatever the file size.
+    """
+    decoder = json.JSONDecoder()
+    buffer = f.read(buffer_size)
+    position = 0
+    eof = not buffer
+
+    def skip(characters):
+        nonlocal buffer, position, eof
+
+        while True:
+            while position < len(buffer) and buffer[position] in characters:
+                position += 1
+
+            if position < len(buffer) or eof:
+                return
+
+            buffer = f.read(buffer_size)
+            position = 0
+            eof = not buffer
+
+    skip(' \t\r\n')
+    is_array = position < len(buffer) and buffer[position] == '['
+
+    if is_array:
+        position += 1
+
+    separators = ' \t\r\n,' if is_array else ' \t\r\n'
+
+    while True:
+        skip(separators)
+
+        if position >= len(buffer):
+            if is_array:
+                raise ValueError('Unterminated JSON array.')
+            return
+
+        if is_array and buffer[position] == ']':
+            return
+
+        try:
+            record, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+
+            chunk = f.read(buffer_size)
+            buffer = buffer[position:] + chunk
+            position = 0
+            eof = not chunk
+            continue
+
+        yield record
+        position = end
+
+
+def import_products(db, records, chunk_size, created_by, progress=None):
+    """Insert products from ``records`` in transactions of ``chunk_size`` rows.
+
+    Invalid records and products already in the catalog are skipped. Returns
+    ``(inserted, skipped)``.
+    """
+    from flaskr.products import find_existing_products, insert_products, validate_products
+
+    inserted = 0
+    skipped = 0
+    chunk = []
+
+    def flush():
+        nonlocal inserted, skipped
+
+        existing_products = find_existing_products(db, chunk)
+        products = [product for product in chunk if (product['product_name'], product['description']) not in existing_products]
+
+        with db:
+            insert_products(db, products, datetime.now(), created_by)
+
+        get_catalog_cache().invalidate()
+
+        inserted += len(products)
+        skipped += len(chunk) - len(products)
+        chunk.clear()
+
+        if progress is not None:
+            progress(inserted, skipped)
+
+    product_keys = set()
+
+    for record in records:
+        error, _ = validate_products([record])
+        product_key = (record['product_name'], record['description']) if error is None else None
+
+        if error is not None or product_key in product_keys:
+            skipped += 1
+            continue
+
+        product_keys.add(product_key)
+        chunk.append(record)
+
+        if len(chunk) >= chunk_size:
+            flush()
+            product_keys.clear()
+
+    if chunk:
+        flush()
+
+    return inserted, skipped
+
+
+@click.command('import-products')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', default=1000, show_default=True, help='Products written per transaction.')
+@click.option('--created-by', default='admin', show_default=True, help='Username recorded as the creator.')
+@with_appcontext
+def import_products_command(path, chunk_size, created_by):
+    """Stream products from a JSON array or JSON lines file into the catalog."""
+    started_at = time.perf_counter()
+
+    def progress(inserted, skipped):
+        elapsed = time.perf_counter() - started_at
+        click.echo(f'{inserted} inserted, {skipped} skipped, {inserted / elapsed:.0f} products/sec')
+
+    with open(path, encoding='utf8') as f:
+        try:
+            inserted, skipped = import_products(get_db(), iter_json_records(f), chunk_size, created_by, progress)
+        except ValueError as error:
+            raise click.ClickException(f'Invalid JSON in {path}: {error}')
+
+    elapsed = time.perf_counter() - started_at
+    click.echo(f'Imported {inserted} products ({skipped} skipped) in {elapsed:.2f}s.')
+
+
 def init_app(app):
     app.teardown_appcontext(close_db)
     app.cli.add_command(init_db_command)
+    app.cli.add_command(import_products_command)
@@ -0,0 +1,267 @@
+import threading
+import time
+from collections import Counter
+
+from flask import Response, abort, current_app, g, request
+
+from flaskr.catalog_cache import get_catalog_cache
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class StatementStats:
+    __slots__ = ('sql', 'duration', 'rows')
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.duration = 0.0
+        self.rows = 0
+
+
+class InstrumentedCursor:
+    """Adds fetch time and returned rows to the statement that opened the cursor."""
+
+    def __init__(self, cursor, stats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def _timed(self, fetch, *args):
+        started_at = time.perf_counter()
+        rows = fetch(*args)
+        self._stats.duration += time.perf_counter() - started_at
+        return rows
+
+    def fetchone(self):
+        row = self._timed(self._cursor.fetchone)
+
+        if row is not None:
+            self._stats.rows += 1
+
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._timed(self._cursor.fetchmany, *args)
+        self._stats.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(self._cursor.fetchall)
+        self._stats.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+
+            if row is None:
+                return
+
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    """Wraps a sqlite3 connection and records every statement run on it.
+
+    Everything that is not a statement is delegated to the connection, so
+    views keep using ``db.commit()``, ``db.IntegrityError`` and ``with db:``.
+    """
+
+    def __init__(self, connection, statements):
+        self._connection = connection
+        self._statements = statements
+
+    def _run(self, method, sql, parameters):
+        stats = StatementStats(sql)
+        self._statements.append(stats)
+
+        started_at = time.perf_counter()
+
+        try:
+            cursor = method(sql, parameters)
+        finally:
+            stats.duration += time.perf_counter() - started_at
+
+        return InstrumentedCursor(cursor, stats)
+
+    def execute(self, sql, parameters=()):
+        return self._run(self._connection.execute, sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self._run(self._connection.executemany, sql, parameters)
+
+    def __enter__(self):
+        self._connection.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._connection.__exit__(*exc_info)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if value <= bound:
+                self.buckets[index] += 1
+
+        self.count += 1
+        self.sum += value
+
+
+class Metrics:
+    """Process-wide request and SQL counters, rendered in Prometheus text format.
+
+    Every gunicorn worker keeps its own counters.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter()
+        self.request_durations = {}
+        self.sql_statements = Counter()
+        self.sql_durations = {}
+        self.sql_rows = Counter()
+        self.repeated_statements = Counter()
+
+    def record(self, endpoint, method, status, duration, statements, repeated):
+        with self._lock:
+            self.requests[(endpoint, method, status)] += 1
+            self.request_durations.setdefault((endpoint, method), Histogram()).observe(duration)
+
+            sql_durations = self.sql_durations.setdefault(endpoint, Histogram())
+
+            for stats in statements:
+                sql_durations.observe(stats.duration)
+                self.sql_rows[endpoint] += stats.rows
+
+            self.sql_statements[endpoint] += len(statements)
+            self.repeated_statements[endpoint] += repeated
+
+    def render(self):
+        lines = []
+
+        with self._lock:
+            lines.append('# TYPE flaskr_requests_total counter')
+
+            for (endpoint, method, status), value in sorted(self.requests.items()):
+                lines.append(f'flaskr_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {value}')
+
+            lines.append('# TYPE flaskr_request_duration_seconds histogram')
+
+            for (endpoint, method), histogram in sorted(self.request_durations.items()):
+                lines += render_histogram('flaskr_request_duration_seconds', f'endpoint="{endpoint}",method="{method}"', histogram)
+
+            lines.append('# TYPE flaskr_sql_statement_duration_seconds histogram')
+
+            for endpoint, histogram in sorted(self.sql_durations.items()):
+                lines += render_histogram('flaskr_sql_statement_duration_seconds', f'endpoint="{endpoint}"', histogram)
+
+            for name, counter in [
+                ('flaskr_sql_statements_total', self.sql_statements),
+                ('flaskr_sql_rows_total', self.sql_rows),
+                ('flaskr_sql_repeated_statements_total', self.repeated_statements)
+            ]:
+                lines.append(f'# TYPE {name} counter')
+
+                for endpoint, value in sorted(counter.items()):
+                    lines.append(f'{name}{{endpoint="{endpoint}"}} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def render_histogram(name, labels, histogram):
+    lines = []
+
+    for bound, value in zip(DURATION_BUCKETS, histogram.buckets):
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {value}')
+
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+    lines.append(f'{name}_sum{{{labels}}} {histogram.sum:.6f}')
+    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+    return lines
+
+
+def render_cache_stats(name, stats):
+    lines = []
+
+    for key, value in stats.items():
+        lines.append(f'# TYPE flaskr_{name}_{key}_total counter')
+        lines.append(f'flaskr_{name}_{key}_total {value}')
+
+    return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def instrument(connection):
+    return InstrumentedConnection(connection, g.setdefault('sql_statements', []))
+
+
+def start_request():
+    if not current_app.config['INSTRUMENTATION']:
+        return
+
+    g.request_started_at = time.perf_counter()
+    g.sql_statements = []
+
+
+def finish_request(response):
+    if 'request_started_at' not in g:
+        return response
+
+    duration = time.perf_counter() - g.request_started_at
+    statements = g.get('sql_statements', [])
+    sql_duration = sum(stats.duration for stats in statements)
+    endpoint = request.endpoint or 'unknown'
+
+    # The same statement text run many times in one request is usually a
+    # query inside a loop that should be batched.
+    repeated = {
+        sql: count for sql, count in Counter(stats.sql for stats in statements).items()
+        if count >= current_app.config['SQL_REPEAT_THRESHOLD']
+    }
+
+    for sql, count in repeated.items():
+        current_app.logger.warning(
+            'repeated_statement endpoint=%s count=%d sql=%r', endpoint, count, ' '.join(sql.split())
+        )
+
+    current_app.logger.info(
+        'request endpoint=%s method=%s status=%d duration_ms=%.2f sql_statements=%d sql_ms=%.2f sql_rows=%d',
+        endpoint, request.method, response.status_code, duration * 1000, len(statements), sql_duration * 1000,
+        sum(stats.rows for stats in statements)
+    )
+
+    metrics.record(endpoint, request.method, response.status_code, duration, statements, sum(repeated.values()))
+
+    response.headers.add(
+        'Server-Timing',
+        f'app;dur={duration * 1000:.2f}, sql;dur={sql_duration * 1000:.2f};desc="{len(statements)} statements"'
+    )
+    return response
+
+
+def metrics_endpoint():
+    if not current_app.config['INSTRUMENTATION']:
+        abort(404)
+
+    body = metrics.render() + render_cache_stats('catalog_cache', get_catalog_cache().stats())
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    """Install the hooks; they only record anything while INSTRUMENTATION is set."""
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.add_url_rule('/metrics', endpoint='metrics', view_func=metrics_endpoint)
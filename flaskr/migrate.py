@@ -0,0 +1,215 @@
+import importlib.util
+import logging
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from flaskr.db import get_db
+
+MIGRATIONS_PATH = os.path.join(os.path.dirname(__file__), 'migrations')
+
+
+def get_migrations():
+    """Return ``(version, name, path)`` for every migration file, oldest first.
+
+    Migration files are named ``<version>_<name>.sql`` or ``<version>_<name>.py``.
+    """
+    migrations = []
+
+    for filename in os.listdir(MIGRATIONS_PATH):
+        match = re.match(r'(\d+)_(\w+)\.(sql|py)$', filename)
+
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_PATH, filename)))
+
+    return sorted(migrations)
+
+
+def get_applied_versions(db):
+    db.execute(
+        'CREATE TABLE IF NOT EXISTS schema_version (version INTEGER, name TEXT, applied_at TIMESTAMP, PRIMARY KEY(version))'
+    )
+    db.commit()
+
+    return {row['version'] for row in db.execute('SELECT version FROM schema_version').fetchall()}
+
+
+def get_pending_migrations(db):
+    applied_versions = get_applied_versions(db)
+    return [migration for migration in get_migrations() if migration[0] not in applied_versions]
+
+
+def add_column(db, table, column, declaration):
+    """Add ``column`` to ``table`` unless an earlier, interrupted run already did."""
+    columns = [row['name'] for row in db.execute(f'PRAGMA table_info({table})').fetchall()]
+
+    if column not in columns:
+        with db:
+            db.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+
+
+def backfill(db, table, sql):
+    """Run ``sql`` over ``table`` one rowid range at a time.
+
+    ``sql`` restricts itself to the rows with ``rowid > :start AND rowid <=
+    :end``; a list of statements runs them in order for each range. Each
+    range is its own short write transaction, followed by a pause of
+    MIGRATION_BACKFILL_PAUSE seconds, so requests keep getting the write
+    lock while a large table is rewritten. ``sql`` should skip rows it
+    already handled, so an interrupted backfill can simply be run again.
+    Returns the number of rows changed.
+    """
+    statements = [sql] if type(sql) == str else sql
+    chunk_size = current_app.config['MIGRATION_BACKFILL_CHUNK_SIZE']
+    pause = current_app.config['MIGRATION_BACKFILL_PAUSE']
+    last_rowid = db.execute(f'SELECT MAX(rowid) AS rowid FROM {table}').fetchone()['rowid'] or 0
+    changed = 0
+
+    for start in range(0, last_rowid, chunk_size):
+        with db:
+            for statement in statements:
+                changed += db.execute(statement, {'start': start, 'end': start + chunk_size}).rowcount
+
+        current_app.logger.info('backfill table=%s rowid=%d/%d changed=%d', table, min(start + chunk_size, last_rowid), last_rowid, changed)
+
+        if pause:
+            time.sleep(pause)
+
+    return changed
+
+
+def apply_migration(db, version, name, path):
+    """Apply one migration and record its version.
+
+    A SQL migration runs in a single transaction. A Python migration's
+    ``upgrade(db)`` manages its own transactions, so that backfills can
+    commit as they go, and has to be safe to run again after an interruption.
+    """
+    if path.endswith('.sql'):
+        with open(path, encoding='utf8') as f:
+            script = f.read()
+
+        try:
+            # executescript commits first, so the transaction is opened inside the script.
+            db.executescript('BEGIN IMMEDIATE;\n' + script)
+        except BaseException:
+            if db.in_transaction:
+                db.rollback()
+
+            raise
+
+    else:
+        spec = importlib.util.spec_from_file_location(f'flaskr.migrations.migration_{version:04d}', path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.upgrade(db)
+
+    db.execute(
+        'INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)',
+        (version, name, datetime.now())
+    )
+    db.commit()
+
+
+def migrate(db, progress=None):
+    """Apply every migration the database has not recorded, oldest first.
+
+    Returns the versions applied. A failing migration stops the run.
+    """
+    applied = []
+
+    for version, name, path in get_pending_migrations(db):
+        apply_migration(db, version, name, path)
+        applied.append(version)
+
+        if progress is not None:
+            progress(version, name)
+
+    return applied
+
+
+def stamp(db):
+    """Record every migration as applied, for a database just created from schema.sql."""
+    get_applied_versions(db)
+
+    with db:
+        db.executemany(
+            'INSERT OR IGNORE INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)',
+            [(version, name, datetime.now()) for version, name, _ in get_migrations()]
+        )
+
+
+def get_recorded_versions():
+    """Read the applied versions without creating anything, so a missing database stays missing."""
+    try:
+        db = sqlite3.connect(f'file:{current_app.config["DATABASE"]}?mode=ro', uri=True)
+    except sqlite3.OperationalError:
+        return set()
+
+    try:
+        return {row[0] for row in db.execute('SELECT version FROM schema_version').fetchall()}
+    except sqlite3.OperationalError:
+        return set()
+    finally:
+        db.close()
+
+
+def check_schema_version():
+    """Warn, or refuse to start with REQUIRE_MIGRATIONS, while migrations are pending."""
+    recorded_versions = get_recorded_versions()
+    pending = [migration for migration in get_migrations() if migration[0] not in recorded_versions]
+
+    if not pending:
+        return
+
+    message = 'Database is missing migrations ' + ', '.join(f'{version:04d}_{name}' for version, name, _ in pending) + '. Run `flask migrate`.'
+
+    if current_app.config['REQUIRE_MIGRATIONS']:
+        raise RuntimeError(message)
+
+    current_app.logger.warning(message)
+
+
+@click.command('migrate')
+@click.option('--chunk-size', type=int, help='Rows per backfill transaction.')
+@click.option('--pause', type=float, help='Seconds to sleep between backfill transactions.')
+@click.option('--list', 'list_only', is_flag=True, help='Only list pending migrations.')
+@with_appcontext
+def migrate_command(chunk_size, pause, list_only):
+    """Apply pending schema migrations without touching existing data."""
+    db = get_db()
+
+    if list_only:
+        for version, name, _ in get_pending_migrations(db):
+            click.echo(f'{version:04d}_{name}')
+        return
+
+    if chunk_size is not None:
+        current_app.config['MIGRATION_BACKFILL_CHUNK_SIZE'] = chunk_size
+
+    if pause is not None:
+        current_app.config['MIGRATION_BACKFILL_PAUSE'] = pause
+
+    current_app.logger.setLevel(logging.INFO)
+    started_at = time.perf_counter()
+
+    def progress(version, name):
+        click.echo(f'Applied {version:04d}_{name} ({time.perf_counter() - started_at:.1f}s).')
+
+    if not migrate(db, progress):
+        click.echo('Database is up to date.')
+
+
+def init_app(app):
+    app.cli.add_command(migrate_command)
+
+    # The flask command is how pending migrations get applied, so it skips the check.
+    if os.environ.get('FLASK_RUN_FROM_CLI') != 'true':
+        with app.app_context():
+            check_schema_version()
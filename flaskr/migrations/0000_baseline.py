@@ -0,0 +1,211 @@
+"""Bring a database created before migrations existed up to the current schema.
+
+Adds the cart status, the order username, total and line snapshots, the
+sales rollups and the product search index, and backfills them from the
+existing carts and orders. Every step checks what is already there, so on a
+database created from a recent schema.sql, or after an interrupted run, it
+only does what is left.
+"""
+from flaskr.migrate import add_column, backfill
+
+# Restricts a rollup statement to the orders of one backfill range that the
+# build still has to count.
+ROLLUP_RANGE = (
+    'oi.rowid > :start AND oi.rowid <= :end '
+    'AND oi.rowid > (SELECT done_rowid FROM migration_rollups) '
+    'AND oi.rowid <= (SELECT end_rowid FROM migration_rollups)'
+)
+
+
+def backfill_rollups(db):
+    """Build the sales rollups from the order history, one order_info range at a time.
+
+    Orders placed while this runs come after ``end_rowid`` and are counted
+    by checkout itself. ``migration_rollups`` records the ranges already
+    added, so an interrupted build resumes where it stopped instead of
+    counting orders twice. A shipment created during the build, for an
+    order in a range not reached yet, is counted twice in sales_by_shipper;
+    `flask rebuild-analytics` corrects that.
+    """
+    with db:
+        started = db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'migration_rollups'").fetchone()
+
+        if started is None:
+            if db.execute('SELECT 1 FROM sales_by_day LIMIT 1').fetchone() is not None:
+                return
+
+            db.execute('CREATE TABLE migration_rollups (done_rowid INTEGER, end_rowid INTEGER)')
+            db.execute('INSERT INTO migration_rollups (done_rowid, end_rowid) SELECT 0, COALESCE(MAX(rowid), 0) FROM order_info')
+
+    backfill(
+        db,
+        'order_info',
+        [
+            'INSERT INTO sales_by_day (day, orders, units, revenue) '
+            'SELECT date(oi.created_at), COUNT(DISTINCT oi.order_id), SUM(ol.quantity), SUM(ol.line_total) FROM order_info AS oi '
+            'JOIN order_lines AS ol '
+            'ON ol.order_id = oi.order_id '
+            f'WHERE {ROLLUP_RANGE} '
+            'GROUP BY date(oi.created_at) '
+            'ON CONFLICT(day) DO UPDATE SET orders = orders + excluded.orders, units = units + excluded.units, revenue = revenue + excluded.revenue',
+
+            # Names are set from the latest order once every range is added.
+            'INSERT INTO sales_by_product (product_id, product_name, units, revenue) '
+            'SELECT ol.product_id, MAX(ol.product_name), SUM(ol.quantity), SUM(ol.line_total) FROM order_info AS oi '
+            'JOIN order_lines AS ol '
+            'ON ol.order_id = oi.order_id '
+            f'WHERE {ROLLUP_RANGE} '
+            'GROUP BY ol.product_id '
+            'ON CONFLICT(product_id) DO UPDATE SET units = units + excluded.units, revenue = revenue + excluded.revenue',
+
+            'INSERT INTO sales_by_category (product_category, units, revenue) '
+            'SELECT ol.product_category, SUM(ol.quantity), SUM(ol.line_total) FROM order_info AS oi '
+            'JOIN order_lines AS ol '
+            'ON ol.order_id = oi.order_id '
+            f'WHERE {ROLLUP_RANGE} '
+            'GROUP BY ol.product_category '
+            'ON CONFLICT(product_category) DO UPDATE SET units = units + excluded.units, revenue = revenue + excluded.revenue',
+
+            'INSERT INTO sales_by_shipper (shipper_id, orders, revenue) '
+            'SELECT oi.shipper_id, COUNT(*), SUM(oi.order_total) FROM order_info AS oi '
+            f'WHERE {ROLLUP_RANGE} AND oi.shipper_id IS NOT NULL '
+            'GROUP BY oi.shipper_id '
+            'ON CONFLICT(shipper_id) DO UPDATE SET orders = orders + excluded.orders, revenue = revenue + excluded.revenue',
+
+            'UPDATE migration_rollups SET done_rowid = MIN(:end, end_rowid) '
+            'WHERE done_rowid < :end'
+        ]
+    )
+
+    # The most recent name wins, as with incremental updates.
+    backfill(
+        db,
+        'sales_by_product',
+        'UPDATE sales_by_product SET product_name = ('
+        '    SELECT latest.product_name FROM order_lines AS latest JOIN order_info AS latest_oi ON latest_oi.order_id = latest.order_id '
+        '    WHERE latest.product_id = sales_by_product.product_id ORDER BY latest_oi.created_at DESC LIMIT 1'
+        ') '
+        'WHERE rowid > :start AND rowid <= :end'
+    )
+
+    with db:
+        db.execute('DROP TABLE migration_rollups')
+
+
+def upgrade(db):
+    add_column(db, 'shopping_cart_info', 'status', 'TEXT')
+    add_column(db, 'order_info', 'username', 'TEXT')
+    add_column(db, 'order_info', 'order_total', 'FLOAT')
+
+    with db:
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS order_lines ('
+            'order_id TEXT, product_id TEXT, product_name TEXT, product_category TEXT, quantity INTEGER, '
+            'unit_price FLOAT, discount FLOAT, line_total FLOAT, '
+            'PRIMARY KEY(order_id, product_id), '
+            'FOREIGN KEY (order_id) REFERENCES order_info(order_id), '
+            'FOREIGN KEY (product_id) REFERENCES product(product_id))'
+        )
+        db.execute('CREATE TABLE IF NOT EXISTS sales_by_day (day TEXT, orders INTEGER, units INTEGER, revenue FLOAT, PRIMARY KEY(day))')
+        db.execute('CREATE TABLE IF NOT EXISTS sales_by_product (product_id TEXT, product_name TEXT, units INTEGER, revenue FLOAT, PRIMARY KEY(product_id))')
+        db.execute('CREATE TABLE IF NOT EXISTS sales_by_category (product_category TEXT, units INTEGER, revenue FLOAT, PRIMARY KEY(product_category))')
+        db.execute('CREATE TABLE IF NOT EXISTS sales_by_shipper (shipper_id TEXT, orders INTEGER, revenue FLOAT, PRIMARY KEY(shipper_id))')
+        db.execute('CREATE INDEX IF NOT EXISTS sales_by_product_revenue ON sales_by_product(revenue DESC)')
+        db.execute('CREATE INDEX IF NOT EXISTS sales_by_product_units ON sales_by_product(units DESC)')
+
+        # Needed by the backfills and the rollup rebuild below. 0001 creates
+        # the other lasting indexes.
+        db.execute('CREATE INDEX IF NOT EXISTS migration_cart_username ON shopping_cart_info(username, created_at, cart_id)')
+        db.execute('CREATE INDEX IF NOT EXISTS product_by_tag_product_id ON product_by_tag(product_id, tag_name)')
+        db.execute('CREATE INDEX IF NOT EXISTS order_lines_product_id ON order_lines(product_id)')
+
+    # Before carts had a status, a user's newest cart was the one being
+    # filled unless it had been ordered.
+    backfill(
+        db,
+        'shopping_cart_info',
+        "UPDATE shopping_cart_info SET status = CASE "
+        "WHEN EXISTS (SELECT 1 FROM order_info WHERE order_id = shopping_cart_info.cart_id) THEN 'ordered' "
+        "WHEN EXISTS (SELECT 1 FROM shopping_cart_info AS newer WHERE newer.username = shopping_cart_info.username "
+        "AND (newer.created_at > shopping_cart_info.created_at OR (newer.created_at = shopping_cart_info.created_at AND newer.cart_id > shopping_cart_info.cart_id))) "
+        "THEN 'abandoned' ELSE 'active' END "
+        'WHERE rowid > :start AND rowid <= :end AND status IS NULL'
+    )
+
+    with db:
+        db.execute('DROP INDEX IF EXISTS migration_cart_username')
+        db.execute("CREATE UNIQUE INDEX IF NOT EXISTS shopping_cart_info_active ON shopping_cart_info(username) WHERE status = 'active'")
+
+    backfill(
+        db,
+        'order_info',
+        'UPDATE order_info SET username = (SELECT username FROM shopping_cart_info WHERE cart_id = order_info.order_id) '
+        'WHERE rowid > :start AND rowid <= :end AND username IS NULL'
+    )
+
+    # Old orders only link to their cart, so their lines get today's prices.
+    backfill(
+        db,
+        'order_info',
+        'INSERT OR IGNORE INTO order_lines (order_id, product_id, product_name, product_category, quantity, unit_price, discount, line_total) '
+        'SELECT oi.order_id, pbc.product_id, p.product_name, p.product_category, pbc.quantity, p.price, p.discount, '
+        'ROUND((p.price - p.discount) * pbc.quantity, 2) FROM order_info AS oi '
+        'JOIN product_by_cart AS pbc ON pbc.cart_id = oi.order_id '
+        'JOIN product AS p ON p.product_id = pbc.product_id '
+        'WHERE oi.rowid > :start AND oi.rowid <= :end AND oi.order_total IS NULL'
+    )
+
+    backfill(
+        db,
+        'order_info',
+        'UPDATE order_info SET order_total = (SELECT ROUND(COALESCE(SUM(line_total), 0), 2) FROM order_lines WHERE order_id = order_info.order_id) '
+        'WHERE rowid > :start AND rowid <= :end AND order_total IS NULL'
+    )
+
+    backfill_rollups(db)
+
+    with db:
+        db.execute('CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5(product_name, description, product_category, tags)')
+
+        # The triggers go in before the backfill so catalog writes made while
+        # it runs are indexed too.
+        db.execute(
+            'CREATE TRIGGER IF NOT EXISTS product_search_insert AFTER INSERT ON product BEGIN '
+            'INSERT INTO product_search (rowid, product_name, description, product_category, tags) '
+            'VALUES (NEW.rowid, NEW.product_name, NEW.description, NEW.product_category, '
+            "(SELECT group_concat(tag_name, ' ') FROM product_by_tag WHERE product_id = NEW.product_id)); "
+            'END'
+        )
+        db.execute(
+            'CREATE TRIGGER IF NOT EXISTS product_search_update AFTER UPDATE OF product_name, description, product_category ON product BEGIN '
+            'UPDATE product_search SET product_name = NEW.product_name, description = NEW.description, product_category = NEW.product_category '
+            'WHERE rowid = NEW.rowid; '
+            'END'
+        )
+        db.execute(
+            'CREATE TRIGGER IF NOT EXISTS product_search_delete AFTER DELETE ON product BEGIN '
+            'DELETE FROM product_search WHERE rowid = OLD.rowid; '
+            'END'
+        )
+        db.execute(
+            'CREATE TRIGGER IF NOT EXISTS product_search_tag_insert AFTER INSERT ON product_by_tag BEGIN '
+            "UPDATE product_search SET tags = (SELECT group_concat(tag_name, ' ') FROM product_by_tag WHERE product_id = NEW.product_id) "
+            'WHERE rowid = (SELECT rowid FROM product WHERE product_id = NEW.product_id); '
+            'END'
+        )
+        db.execute(
+            'CREATE TRIGGER IF NOT EXISTS product_search_tag_delete AFTER DELETE ON product_by_tag BEGIN '
+            "UPDATE product_search SET tags = (SELECT group_concat(tag_name, ' ') FROM product_by_tag WHERE product_id = OLD.product_id) "
+            'WHERE rowid = (SELECT rowid FROM product WHERE product_id = OLD.product_id); '
+            'END'
+        )
+
+    backfill(
+        db,
+        'product',
+        'INSERT INTO product_search (rowid, product_name, description, product_category, tags) '
+        'SELECT rowid, product_name, description, product_category, '
+        "(SELECT group_concat(tag_name, ' ') FROM product_by_tag WHERE product_id = product.product_id) FROM product "
+        'WHERE rowid > :start AND rowid <= :end '
+        'AND NOT EXISTS (SELECT 1 FROM product_search WHERE rowid = product.rowid)'
+    )
@@ -0,0 +1,18 @@
+-- Indexes for the lookups the blueprints run, checked with
+-- benchmarks/query_plans.py. IF NOT EXISTS skips those a database created
+-- from a recent schema.sql already has.
+
+CREATE INDEX IF NOT EXISTS product_created_at ON product(created_at, product_id);
+CREATE INDEX IF NOT EXISTS product_by_tag_product_id ON product_by_tag(product_id, tag_name);
+CREATE INDEX IF NOT EXISTS product_by_cart_product_id ON product_by_cart(product_id);
+CREATE INDEX IF NOT EXISTS product_wishlist_product_id ON product_wishlist(product_id);
+CREATE INDEX IF NOT EXISTS order_info_username ON order_info(username, created_at);
+CREATE INDEX IF NOT EXISTS order_lines_product_id ON order_lines(product_id);
+
+-- The customer listing only shows products in stock, so a partial index
+-- replaces the full one.
+DROP INDEX IF EXISTS product_total_sold;
+CREATE INDEX IF NOT EXISTS product_in_stock_total_sold ON product(total_sold DESC, product_id) WHERE in_stock > 0;
+
+-- Search goes through product_search; no query filters on description.
+DROP INDEX IF EXISTS description;
@@ -0,0 +1,29 @@
+-- Bumped by every write to the catalog, whichever code path makes it. The
+-- catalog endpoints derive their ETag and Last-Modified from this row.
+CREATE TABLE IF NOT EXISTS catalog_revision (
+    id INTEGER PRIMARY KEY,
+    revision INTEGER,
+    updated_at INTEGER
+);
+
+INSERT OR IGNORE INTO catalog_revision (id, revision, updated_at) VALUES (1, 0, CAST(strftime('%s', 'now') AS INTEGER));
+
+CREATE TRIGGER IF NOT EXISTS catalog_revision_product_insert AFTER INSERT ON product BEGIN
+    UPDATE catalog_revision SET revision = revision + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER) WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS catalog_revision_product_update AFTER UPDATE ON product BEGIN
+    UPDATE catalog_revision SET revision = revision + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER) WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS catalog_revision_product_delete AFTER DELETE ON product BEGIN
+    UPDATE catalog_revision SET revision = revision + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER) WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS catalog_revision_tag_insert AFTER INSERT ON product_by_tag BEGIN
+    UPDATE catalog_revision SET revision = revision + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER) WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS catalog_revision_tag_delete AFTER DELETE ON product_by_tag BEGIN
+    UPDATE catalog_revision SET revision = revision + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER) WHERE id = 1;
+END;
@@ -0,0 +1,15 @@
+ALTER TABLE shopping_cart_info ADD COLUMN version INTEGER NOT NULL DEFAULT 0;
+
+-- Bumped by every write to a cart's lines, so a worker can tell whether the
+-- cart it cached is still current.
+CREATE TRIGGER IF NOT EXISTS cart_version_insert AFTER INSERT ON product_by_cart BEGIN
+    UPDATE shopping_cart_info SET version = version + 1 WHERE cart_id = NEW.cart_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cart_version_update AFTER UPDATE ON product_by_cart BEGIN
+    UPDATE shopping_cart_info SET version = version + 1 WHERE cart_id = NEW.cart_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cart_version_delete AFTER DELETE ON product_by_cart BEGIN
+    UPDATE shopping_cart_info SET version = version + 1 WHERE cart_id = OLD.cart_id;
+END;
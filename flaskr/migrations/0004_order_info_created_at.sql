@@ -0,0 +1,4 @@
+-- Lets the date-filtered order export read only the orders in its range
+-- instead of walking every order_info row in primary key order.
+
+CREATE INDEX IF NOT EXISTS order_info_created_at ON order_info(created_at, order_id);
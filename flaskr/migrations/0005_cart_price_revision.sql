@@ -0,0 +1,11 @@
+ALTER TABLE catalog_revision ADD COLUMN price_revision INTEGER NOT NULL DEFAULT 0;
+
+-- Bumped only by writes that change what a cart line shows, so cached carts
+-- survive the stock updates of every checkout.
+CREATE TRIGGER IF NOT EXISTS catalog_price_revision_update AFTER UPDATE OF product_name, price, discount ON product BEGIN
+    UPDATE catalog_revision SET price_revision = price_revision + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS catalog_price_revision_delete AFTER DELETE ON product BEGIN
+    UPDATE catalog_revision SET price_revision = price_revision + 1 WHERE id = 1;
+END;
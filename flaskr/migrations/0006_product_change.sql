@@ -0,0 +1,35 @@
+-- One row per write that changes a product or tag list the catalog cache
+-- may hold, so a worker can forget just those products. Stock updates
+-- only count when the product goes in or out of stock. Older rows are
+-- pruned; a worker that fell further behind drops its whole cache.
+CREATE TABLE IF NOT EXISTS product_change (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_id TEXT
+);
+
+CREATE TRIGGER IF NOT EXISTS product_change_update AFTER UPDATE ON product
+WHEN NEW.product_name IS NOT OLD.product_name
+    OR NEW.description IS NOT OLD.description
+    OR NEW.product_category IS NOT OLD.product_category
+    OR NEW.price IS NOT OLD.price
+    OR NEW.discount IS NOT OLD.discount
+    OR (NEW.in_stock > 0) IS NOT (OLD.in_stock > 0)
+BEGIN
+    INSERT INTO product_change (product_id) VALUES (NEW.product_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS product_change_delete AFTER DELETE ON product BEGIN
+    INSERT INTO product_change (product_id) VALUES (OLD.product_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS product_change_tag_insert AFTER INSERT ON product_by_tag BEGIN
+    INSERT INTO product_change (product_id) VALUES (NEW.product_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS product_change_tag_delete AFTER DELETE ON product_by_tag BEGIN
+    INSERT INTO product_change (product_id) VALUES (OLD.product_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS product_change_prune AFTER INSERT ON product_change WHEN NEW.seq % 1000 = 0 BEGIN
+    DELETE FROM product_change WHERE seq <= NEW.seq - 10000;
+END;
@@ -1,101 +1,193 @@
 from datetime import datetime
 
-from flask import Blueprint, g, request
+from flask import Blueprint, Response, g, json, request, stream_with_context
 
+from flaskr.analytics import record_order
 from flaskr.auth import login_required, authorization_required
-from flaskr.db import get_db
+from flaskr.catalog_cache import get_catalog_cache
+from flaskr.db import get_db, run_in_transaction
+from flaskr.shopping_cart import cart_cache, get_active_cart, touch_cart
 
 bp = Blueprint('orders', __name__, url_prefix='/orders')
 
 
-@bp.route('/make-order', methods=['POST'])
-@login_required
-def make_order():
-    response = {
-        'isSuccess': False,
-        'message': 'Create an Order'
-    }
+class CheckoutError(Exception):
+    pass
 
-    db = get_db()
-    username = g.user['username']
 
-    check_shopping_cart = db.execute(
-        'SELECT * FROM shopping_cart_info '
-        'WHERE username = ? '
-        'ORDER BY created_at DESC '
-        'LIMIT 1',
-        (username,)
+def checkout(db, order_id, username, created_at, payment_method, delivery_address):
+    """Place the order and take its items out of stock.
+
+    Runs inside one write transaction. Prices are copied into order_lines so
+    later price changes do not rewrite order history. Returns the order
+    lines. Raises
+    ``CheckoutError`` when the cart was already ordered or a product no
+    longer has enough stock, so nothing is written.
+    """
+    cart_products = db.execute(
+        'SELECT pbc.product_id, pbc.quantity, p.product_name, p.product_category, p.price, p.discount FROM product_by_cart AS pbc '
+        'JOIN product AS p '
+        'ON p.product_id = pbc.product_id '
+        'WHERE pbc.cart_id = ?',
+        (order_id,)
     ).fetchall()
 
-    if len(check_shopping_cart) == 0:
-        response['error'] = 'No products in the cart'
-        return response
+    order_lines = []
 
-    else:
-        shopping_cart_info = dict(check_shopping_cart[0])
+    for product in cart_products:
+        order_lines.append({
+            'order_id': order_id,
+            'product_id': product['product_id'],
+            'product_name': product['product_name'],
+            'product_category': product['product_category'],
+            'quantity': product['quantity'],
+            'unit_price': product['price'],
+            'discount': product['discount'],
+            'line_total': round((product['price'] - product['discount']) * product['quantity'], 2)
+        })
 
-        check_order = db.execute(
-            'SELECT * FROM order_info '
-            'WHERE order_id = ? '
-            'LIMIT 1',
-            (shopping_cart_info['cart_id'],)
-        ).fetchall()
+    order_total = round(sum(order_line['line_total'] for order_line in order_lines), 2)
 
-        if len(check_order) != 0:
-            response['error'] = 'No products in the cart'
-            return response
+    try:
+        db.execute(
+            f'INSERT INTO order_info(order_id, username, created_at, payment_method, delivery_address, order_total) VALUES (?, ?, ?, ?, ?, ?)',
+            (
+                order_id,
+                username,
+                created_at,
+                payment_method,
+                delivery_address,
+                order_total
+            )
+        )
+    except db.IntegrityError:
+        raise CheckoutError(f'Order id "{order_id}" already exists.')
 
-    order_id = shopping_cart_info['cart_id']
-    created_at = datetime.now()
+    ordered = db.execute(
+        "UPDATE shopping_cart_info SET status = 'ordered', updated_at = ? "
+        "WHERE cart_id = ? AND status = 'active'",
+        (created_at, order_id)
+    ).rowcount
 
-    check_product_status = db.execute(
-        'SELECT p.product_id, p.product_name, p.in_stock, pbc.quantity FROM product AS p '
-        'JOIN product_by_cart AS pbc '
-        'ON p.product_id = pbc.product_id '
-        'WHERE pbc.cart_id = ? ',
-        (shopping_cart_info['cart_id'],)
-    ).fetchall()
+    if ordered == 0:
+        raise CheckoutError('No products in the cart')
 
-    for product in check_product_status:
-        if product['in_stock'] < product['quantity']:
-            response['error'] = f'Not enough {product["product_name"]}.'
-            return response
+    db.executemany(
+        'INSERT INTO order_lines(order_id, product_id, product_name, product_category, quantity, unit_price, discount, line_total) '
+        'VALUES (:order_id, :product_id, :product_name, :product_category, :quantity, :unit_price, :discount, :line_total)',
+        order_lines
+    )
 
-    for product in check_product_status:
-        db.execute(
+    record_order(db, created_at, order_lines)
+
+    for product in cart_products:
+        # The stock condition makes an oversold line update nothing.
+        updated = db.execute(
             'UPDATE product SET in_stock = in_stock - ?, total_sold = total_sold + ?, updated_at = ? '
-            'WHERE product_id = ?',
-            (product['quantity'], product['quantity'], created_at, product['product_id'])
-        )
-        db.commit()
+            'WHERE product_id = ? AND in_stock >= ?',
+            (product['quantity'], product['quantity'], created_at, product['product_id'], product['quantity'])
+        ).rowcount
+
+        if updated == 0:
+            stock = db.execute(
+                'SELECT product_name FROM product '
+                'WHERE product_id = ?',
+                (product['product_id'],)
+            ).fetchone()
+
+            if stock is None:
+                raise CheckoutError(f'Product {product["product_id"]} is no longer available.')
+
+            raise CheckoutError(f'Not enough {stock["product_name"]}.')
+
+    return order_lines
+
+
+@bp.route('/make-order', methods=['POST'])
+@login_required
+def make_order():
+    response = {
+        'isSuccess': False,
+        'message': 'Create an Order'
+    }
 
     body_details = request.get_json()
 
-    if 'payment_method' not in body_details or 'delivery_address' not in body_details:
+    if not body_details or 'payment_method' not in body_details or 'delivery_address' not in body_details:
         response['error'] = 'Body key missing. payment_method or delivery_address.'
         return response
 
+    db = get_db()
+    username = g.user['username']
+
+    shopping_cart_info = get_active_cart(db, username)
+
+    if shopping_cart_info is None:
+        response['error'] = 'No products in the cart'
+        return response
+
+    order_id = shopping_cart_info['cart_id']
+    created_at = datetime.now()
+
     try:
-        db.execute(
-            f'INSERT INTO order_info(order_id, created_at, payment_method, delivery_address) VALUES (?, ?, ?, ?)',
-            (
+        order_lines = run_in_transaction(
+            lambda db: checkout(
+                db,
                 order_id,
+                username,
                 created_at,
                 body_details['payment_method'],
                 body_details['delivery_address']
             )
         )
-        db.commit()
-
-    except db.IntegrityError:
-        response['error'] = f'Order id "{order_id}" already exists.'
+    except CheckoutError as error:
+        response['error'] = str(error)
         return response
 
+    touch_cart()
+    cart_cache.delete(username)
+    get_catalog_cache().invalidate([order_line['product_id'] for order_line in order_lines])
+
     response['isSuccess'] = True
     response['order_id'] = order_id
     return response
 
 
+def group_order_lines(orders, include_username=False):
+    """Nest order_lines rows, ordered by order, under their order id."""
+    orders_categorised = {}
+    total_money_spent = 0
+
+    for order_line in orders:
+        if order_line['order_id'] not in orders_categorised:
+            order = {
+                'created_at': order_line['created_at'],
+                'payment_method': order_line['payment_method'],
+                'delivery_address': order_line['delivery_address'],
+                'order_total': order_line['order_total']
+            }
+
+            if include_username:
+                order['username'] = order_line['username']
+
+            order['products'] = []
+            orders_categorised[order_line['order_id']] = order
+            total_money_spent += order_line['order_total']
+
+        orders_categorised[order_line['order_id']]['products'].append(
+            {
+                'product_id': order_line['product_id'],
+                'product_name': order_line['product_name'],
+                'price': order_line['unit_price'],
+                'discount': order_line['discount'],
+                'quantity': order_line['quantity'],
+                'line_total': order_line['line_total']
+            }
+        )
+
+    return orders_categorised, round(total_money_spent, 2)
+
+
 @bp.route('/get-all-orders', methods=['GET'])
 @login_required
 def get_all_orders():
@@ -108,60 +200,16 @@ def get_all_orders():
 
     db = get_db()
 
-    get_total_money_spent = db.execute(
-        'SELECT SUM((p.price - p.discount) * pbc.quantity) AS product_total_price FROM order_info AS oi '
-        'JOIN product_by_cart AS pbc '
-        'ON oi.order_id = pbc.cart_id '
-        'JOIN shopping_cart_info AS sci '
-        'ON pbc.cart_id = sci.cart_id '
-        'JOIN product AS p '
-        'ON p.product_id = pbc.product_id '
-        'WHERE sci.username = ?',
-        (username,)
-    ).fetchall()
-
-    total_money_spent = get_total_money_spent[0]['product_total_price']
-
     orders = db.execute(
-        'SELECT oi.order_id, oi.created_at, oi.payment_method, oi.delivery_address, pbc.product_id, pbc.quantity, p.product_name, p.price FROM order_info AS oi '
-        'JOIN product_by_cart AS pbc '
-        'ON oi.order_id = pbc.cart_id '
-        'JOIN shopping_cart_info AS sci '
-        'ON pbc.cart_id = sci.cart_id '
-        'JOIN product AS p '
-        'ON p.product_id = pbc.product_id '
-        'WHERE sci.username = ?',
+        'SELECT oi.order_id, oi.created_at, oi.payment_method, oi.delivery_address, oi.order_total, ol.product_id, ol.product_name, ol.quantity, ol.unit_price, ol.discount, ol.line_total FROM order_info AS oi '
+        'JOIN order_lines AS ol '
+        'ON ol.order_id = oi.order_id '
+        'WHERE oi.username = ? '
+        'ORDER BY oi.created_at ASC, oi.order_id ASC',
         (username,)
     ).fetchall()
 
-    orders_categorised = {}
-
-    for i in orders:
-        formatted_data = dict(i)
-
-        if formatted_data['order_id'] not in orders_categorised:
-            orders_categorised[formatted_data['order_id']] = {
-                'created_at': formatted_data['created_at'],
-                'payment_method': formatted_data['payment_method'],
-                'delivery_address': formatted_data['delivery_address'],
-                'products': [
-                    {
-                        'product_id': formatted_data['product_id'],
-                        'product_name': formatted_data['product_name'],
-                        'price': formatted_data['price'],
-                        'quantity': formatted_data['quantity']
-                    }
-                ]
-            }
-        else:
-            orders_categorised[formatted_data['order_id']]['products'].append(
-                {
-                    'product_id': formatted_data['product_id'],
-                    'product_name': formatted_data['product_name'],
-                    'price': formatted_data['price'],
-                    'quantity': formatted_data['quantity']
-                }
-            )
+    orders_categorised, total_money_spent = group_order_lines(orders)
 
     response['isSuccess'] = True
     response['total_money_spent'] = total_money_spent
@@ -180,59 +228,110 @@ def get_all_customers_orders():
 
     db = get_db()
 
-    get_total_money_spent = db.execute(
-        'SELECT SUM((p.price - p.discount) * pbc.quantity) AS product_total_price FROM order_info AS oi '
-        'JOIN product_by_cart AS pbc '
-        'ON oi.order_id = pbc.cart_id '
-        'JOIN shopping_cart_info AS sci '
-        'ON pbc.cart_id = sci.cart_id '
-        'JOIN product AS p '
-        'ON p.product_id = pbc.product_id '
-    ).fetchall()
-
-    total_money_spent = get_total_money_spent[0]['product_total_price']
-
     orders = db.execute(
-        'SELECT oi.order_id, oi.created_at, oi.payment_method, oi.delivery_address, pbc.product_id, pbc.quantity, p.product_name, p.price, sci.username FROM order_info AS oi '
-        'JOIN product_by_cart AS pbc '
-        'ON oi.order_id = pbc.cart_id '
-        'JOIN shopping_cart_info AS sci '
-        'ON pbc.cart_id = sci.cart_id '
-        'JOIN product AS p '
-        'ON p.product_id = pbc.product_id '
+        'SELECT oi.order_id, oi.username, oi.created_at, oi.payment_method, oi.delivery_address, oi.order_total, ol.product_id, ol.product_name, ol.quantity, ol.unit_price, ol.discount, ol.line_total FROM order_info AS oi '
+        'JOIN order_lines AS ol '
+        'ON ol.order_id = oi.order_id '
+        'ORDER BY oi.order_id ASC'
     ).fetchall()
 
-    orders_categorised = {}
-
-    for i in orders:
-        formatted_data = dict(i)
-
-        if formatted_data['order_id'] not in orders_categorised:
-            orders_categorised[formatted_data['order_id']] = {
-                'created_at': formatted_data['created_at'],
-                'payment_method': formatted_data['payment_method'],
-                'delivery_address': formatted_data['delivery_address'],
-                'username': formatted_data['username'],
-                'products': [
-                    {
-                        'product_id': formatted_data['product_id'],
-                        'product_name': formatted_data['product_name'],
-                        'price': formatted_data['price'],
-                        'quantity': formatted_data['quantity']
-                    }
-                ]
-            }
-        else:
-            orders_categorised[formatted_data['order_id']]['products'].append(
-                {
-                    'product_id': formatted_data['product_id'],
-                    'product_name': formatted_data['product_name'],
-                    'price': formatted_data['price'],
-                    'quantity': formatted_data['quantity']
-                }
-            )
+    orders_categorised, total_money_spent = group_order_lines(orders, include_username=True)
 
     response['isSuccess'] = True
     response['total_purchase_made'] = total_money_spent
     response['orders'] = orders_categorised
     return response
+
+
+def iter_orders(orders):
+    """Yield one dict per order from order_lines rows that are ordered by order_id."""
+    order = None
+
+    for i in orders:
+        if order is None or order['order_id'] != i['order_id']:
+            if order is not None:
+                yield order
+
+            order = {
+                'order_id': i['order_id'],
+                'username': i['username'],
+                'created_at': i['created_at'],
+                'payment_method': i['payment_method'],
+                'delivery_address': i['delivery_address'],
+                'order_total': i['order_total'],
+                'products': []
+            }
+
+        order['products'].append(
+            {
+                'product_id': i['product_id'],
+                'product_name': i['product_name'],
+                'price': i['unit_price'],
+                'discount': i['discount'],
+                'quantity': i['quantity'],
+                'line_total': i['line_total']
+            }
+        )
+
+    if order is not None:
+        yield order
+
+
+@bp.route('/export-customers-orders', methods=['GET'])
+@login_required
+@authorization_required
+def export_customers_orders():
+    """Stream every order, oldest first, as NDJSON (default) or as a JSON array with ``format=json``.
+
+    ``from`` and ``to`` take ISO dates or datetimes and keep orders created
+    at or after ``from`` and before ``to``. Rows are read from the cursor as
+    the response is written, so memory does not grow with order history.
+    """
+    response = {
+        'isSuccess': False,
+        'message': 'Export all Orders'
+    }
+
+    output_format = request.args.get('format', 'ndjson')
+
+    if output_format not in ['ndjson', 'json']:
+        response['error'] = 'format should be ndjson or json.'
+        return response
+
+    try:
+        created_from = datetime.fromisoformat(request.args.get('from', '0001-01-01'))
+        created_to = datetime.fromisoformat(request.args.get('to', '9999-12-31'))
+    except ValueError:
+        response['error'] = 'from and to should be ISO dates.'
+        return response
+
+    db = get_db()
+
+    # The created_at index both narrows the range and keeps an order's lines
+    # together, so rows stream out without a sort.
+    orders = db.execute(
+        'SELECT oi.order_id, oi.username, oi.created_at, oi.payment_method, oi.delivery_address, oi.order_total, ol.product_id, ol.product_name, ol.quantity, ol.unit_price, ol.discount, ol.line_total FROM order_info AS oi '
+        'JOIN order_lines AS ol '
+        'ON ol.order_id = oi.order_id '
+        'WHERE oi.created_at >= ? AND oi.created_at < ? '
+        'ORDER BY oi.created_at ASC, oi.order_id ASC',
+        (created_from, created_to)
+    )
+
+    def generate():
+        if output_format == 'ndjson':
+            for order in iter_orders(orders):
+                yield json.dumps(order, separators=(',', ':')) + '\n'
+            return
+
+        separator = '['
+
+        for order in iter_orders(orders):
+            yield separator + json.dumps(order, separators=(',', ':'))
+            separator = ',\n'
+
+        yield '[]' if separator == '[' else ']'
+
+    mimetype = 'application/x-ndjson' if output_format == 'ndjson' else 'application/json'
+
+    return Response(stream_with_context(generate()), mimetype=mimetype)
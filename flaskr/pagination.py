@@ -0,0 +1,139 @@
+import base64
+import binascii
+import hmac
+import json
+import os
+
+from flask import current_app, request
+
+# Cursors are padded to a multiple of this many bytes, so their length does
+# not tell how large the values inside are.
+CURSOR_BLOCK_SIZE = 64
+
+
+def get_cursor_keys():
+    secret = current_app.secret_key
+
+    if type(secret) == str:
+        secret = secret.encode('utf8')
+
+    return (
+        hmac.new(secret, b'flaskr-cursor-encrypt', 'sha256').digest(),
+        hmac.new(secret, b'flaskr-cursor-sign', 'sha256').digest()
+    )
+
+
+def keystream(key, nonce, size):
+    blocks = [hmac.new(key, nonce + counter.to_bytes(4, 'big'), 'sha256').digest() for counter in range(size // 32 + 1)]
+    return b''.join(blocks)[:size]
+
+
+def encode_cursor(values):
+    """Encrypt and sign the cursor with the app secret.
+
+    Cursors carry the values of the columns a page is ordered by, such as
+    total_sold, which customers must not see, so clients can neither read
+    nor alter them.
+    """
+    encrypt_key, sign_key = get_cursor_keys()
+    plaintext = json.dumps(values, default=str).encode('utf8')
+    plaintext += b' ' * (-len(plaintext) % CURSOR_BLOCK_SIZE)
+    nonce = os.urandom(16)
+    ciphertext = bytes(a ^ b for a, b in zip(plaintext, keystream(encrypt_key, nonce, len(plaintext))))
+    tag = hmac.new(sign_key, nonce + ciphertext, 'sha256').digest()[:16]
+
+    return base64.urlsafe_b64encode(nonce + ciphertext + tag).decode('ascii')
+
+
+def decode_cursor(cursor, size):
+    encrypt_key, sign_key = get_cursor_keys()
+
+    try:
+        token = base64.urlsafe_b64decode(cursor.encode('ascii'))
+    except (ValueError, binascii.Error):
+        raise ValueError('Invalid cursor.')
+
+    nonce, ciphertext, tag = token[:16], token[16:-16], token[-16:]
+
+    if len(token) < 32 or not hmac.compare_digest(tag, hmac.new(sign_key, nonce + ciphertext, 'sha256').digest()[:16]):
+        raise ValueError('Invalid cursor.')
+
+    plaintext = bytes(a ^ b for a, b in zip(ciphertext, keystream(encrypt_key, nonce, len(ciphertext))))
+
+    try:
+        values = json.loads(plaintext)
+    except ValueError:
+        raise ValueError('Invalid cursor.')
+
+    if type(values) != list or len(values) != size:
+        raise ValueError('Invalid cursor.')
+
+    return values
+
+
+def get_page_args(cursor_size):
+    """Read ``limit`` and ``cursor`` from the query string.
+
+    Without ``limit`` the whole result set is returned, as before pagination
+    existed. Raises ``ValueError`` with a client facing message.
+    """
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError('limit should be an integer.')
+
+        if limit < 1 or limit > current_app.config['MAX_PAGE_SIZE']:
+            raise ValueError(f'limit should be between 1 and {current_app.config["MAX_PAGE_SIZE"]}.')
+
+    if cursor is not None:
+        cursor = decode_cursor(cursor, cursor_size)
+
+    return limit, cursor
+
+
+def get_fields(allowed_fields):
+    """Read the ``fields`` projection from the query string.
+
+    Returns every allowed field when no projection is requested. Raises
+    ``ValueError`` with a client facing message.
+    """
+    fields = request.args.get('fields')
+
+    if not fields:
+        return list(allowed_fields)
+
+    fields = [field.strip() for field in fields.split(',') if field.strip()]
+
+    for field in fields:
+        if field not in allowed_fields:
+            raise ValueError(f'Unknown field {field}.')
+
+    return fields
+
+
+def sql_limit(limit):
+    # One extra row tells whether another page exists; -1 means no limit.
+    return limit + 1 if limit is not None else -1
+
+
+def paginate(rows, limit, cursor_columns):
+    next_cursor = None
+
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1][column] for column in cursor_columns])
+
+    return rows, next_cursor
+
+
+def project(rows, fields):
+    if not rows:
+        return []
+
+    columns = [field for field in fields if field in rows[0].keys()]
+
+    return [{column: row[column] for column in columns} for row in rows]
@@ -1,13 +1,201 @@
+import functools
+import hashlib
+import re
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 
-from flask import Blueprint, g, request, jsonify
+from flask import Blueprint, g, request, jsonify, make_response
 
 from flaskr.auth import login_required, authorization_required
-from flaskr.db import get_db
+from flaskr.catalog_cache import get_catalog_cache
+from flaskr.compression import choose_encoding, snapshot
+from flaskr.db import chunked, get_db
+from flaskr.pagination import get_fields, get_page_args, paginate, project, sql_limit
+from flaskr.shopping_cart import CART_PRICE_COLUMNS, cart_cache
 
 bp = Blueprint('products', __name__, url_prefix='/products')
 
+PRODUCT_COLUMNS = [
+    'product_id', 'product_name', 'description', 'product_category', 'price', 'discount',
+    'created_at', 'created_by', 'updated_at', 'updated_by', 'in_stock', 'total_sold'
+]
+CUSTOMER_PRODUCT_COLUMNS = PRODUCT_COLUMNS[:6]
+UPDATABLE_PRODUCT_COLUMNS = ['product_name', 'description', 'product_category', 'price', 'discount', 'in_stock']
+
+
+def get_tags_by_product(db, product_ids):
+    tags_by_product = {product_id: [] for product_id in product_ids}
+
+    for chunk in chunked(tags_by_product):
+        placeholders = ', '.join('?' * len(chunk))
+
+        product_tags = db.execute(
+            'SELECT product_id, tag_name FROM product_by_tag '
+            f'WHERE product_id IN ({placeholders})',
+            chunk
+        ).fetchall()
+
+        for tag in product_tags:
+            tags_by_product[tag['product_id']].append(tag['tag_name'])
+
+    return tags_by_product
+
+
+def get_cached_tags_by_product(db, product_ids):
+    return get_catalog_cache().get_many('tags:', product_ids, lambda missing_ids: get_tags_by_product(db, missing_ids))
+
+
+def get_catalog_revision(db):
+    return db.execute('SELECT revision, updated_at FROM catalog_revision WHERE id = 1').fetchone()
+
+
+def catalog_conditional_get(view):
+    """Answer unchanged catalog reads with 304 Not Modified.
+
+    The ETag is derived from the catalog revision, which triggers bump on
+    every product and product tag write, the user's role and the full URL.
+    A matching If-None-Match, including the ETag of the compressed variant
+    the client accepts, returns before the view runs any product query.
+    """
+    @functools.wraps(view)
+    def wrapped_view(**kwargs):
+        db = get_db()
+        catalog_revision = get_catalog_revision(db)
+        etag_source = f'{catalog_revision["revision"]}:{g.user["role"]}:{request.full_path}'
+        etag = 'catalog-' + hashlib.sha1(etag_source.encode('utf8')).hexdigest()[:16]
+        last_modified = datetime.fromtimestamp(catalog_revision['updated_at'], timezone.utc)
+
+        # Entries this worker cached before another one changed the catalog
+        # must not be served under the new revision's ETag.
+        get_catalog_cache().sync(db, catalog_revision['revision'])
+        g.catalog_etag = etag
+
+        # Only the variant this client would be sent can still be fresh for it.
+        encoding = choose_encoding()
+        candidates = [etag] if encoding is None else [etag, f'{etag}-{encoding}']
+        matched_etag = next((candidate for candidate in candidates if candidate in request.if_none_match), None)
+
+        if matched_etag is not None:
+            response = make_response('', 304)
+            response.set_etag(matched_etag)
+        else:
+            response = make_response(view(**kwargs))
+            response.set_etag(etag)
+
+        # Responses depend on who is logged in, so only the browser may keep them.
+        response.last_modified = last_modified
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+
+        return response
+
+    return wrapped_view
+
+
+def customer_catalog_snapshot(view):
+    """Serve customers the response built for this ETag, compressed once per catalog revision."""
+    @functools.wraps(view)
+    def wrapped_view(**kwargs):
+        if g.user['role'] == 'admin':
+            return view(**kwargs)
+
+        return snapshot(g.catalog_etag, lambda: view(**kwargs))
+
+    return wrapped_view
+
+
+def validate_products(products):
+    """Return ``(error, product)`` for the first invalid product, or ``(None, None)``."""
+    product_keys = set()
+
+    for product in products:
+        if type(product) != dict:
+            return 'Each product should be an object.', product
+
+        if 'product_name' not in product or 'description' not in product or 'product_category' not in product or 'price' not in product or 'discount' not in product or 'in_stock' not in product:
+            return 'A key is missing.', product
+
+        if 'tags' in product and type(product['tags']) != list:
+            return 'Wrong type for tags.', product
+
+        product_key = (product['product_name'], product['description'])
+
+        if product_key in product_keys:
+            return f'Product {product["product_name"]} appeared more than once in the body.', product
+
+        product_keys.add(product_key)
+
+    return None, None
+
+
+def find_existing_products(db, products):
+    """Return the ``(product_name, description)`` pairs of ``products`` already in the catalog."""
+    product_keys = {(product['product_name'], product['description']) for product in products}
+    existing_keys = set()
+
+    for chunk in chunked({product_name for product_name, _ in product_keys}):
+        placeholders = ', '.join('?' * len(chunk))
+
+        existing_products = db.execute(
+            'SELECT product_name, description FROM product '
+            f'WHERE product_name IN ({placeholders})',
+            chunk
+        ).fetchall()
+
+        for product in existing_products:
+            existing_keys.add((product['product_name'], product['description']))
+
+    return product_keys & existing_keys
+
+
+def insert_products(db, products, created_at, created_by):
+    """Insert validated products and their tags with one executemany per table.
+
+    Assigns ``product_id`` and the creation columns on each product dict. The
+    caller owns the transaction.
+    """
+    tag_names = set()
+    product_tags = []
+
+    for product in products:
+        product['product_id'] = str(uuid.uuid4())
+        product['created_at'] = created_at
+        product['created_by'] = created_by
+        product['total_sold'] = 0
+
+        for tag in product.get('tags', []):
+            tag_names.add(tag)
+            product_tags.append((tag, product['product_id']))
+
+    db.executemany(
+        'INSERT INTO product (product_id, product_name, description, product_category, price, discount, created_at, created_by, in_stock, total_sold) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        [
+            (
+                product['product_id'],
+                product['product_name'],
+                product['description'],
+                product['product_category'],
+                product['price'],
+                product['discount'],
+                product['created_at'],
+                product['created_by'],
+                product['in_stock'],
+                product['total_sold']
+            )
+            for product in products
+        ]
+    )
+
+    db.executemany(
+        'INSERT OR IGNORE INTO product_tags (tag_name, created_at, created_by) VALUES (?, ?, ?)',
+        [(tag, created_at, created_by) for tag in tag_names]
+    )
+
+    db.executemany(
+        'INSERT OR IGNORE INTO product_by_tag (tag_name, product_id) VALUES (?, ?)',
+        product_tags
+    )
+
 
 @bp.route('/add-product', methods=['POST'])
 @login_required
@@ -22,333 +210,458 @@ def add_product():
 
     body = dict(request.get_json())
 
-    product_names = []
-
     if 'products' not in body:
         response['error'] = 'products key not provided'
         return response
 
-    else:
-        if type(body['products']) != list:
-            response['error'] = 'products key should be a list or array'
-            return response
+    if type(body['products']) != list:
+        response['error'] = 'products key should be a list or array'
+        return response
 
-        for product in body['products']:
-            product_existence_check = product['product_name'] + product['description']
+    error, product = validate_products(body['products'])
 
-            if product_existence_check not in product_names:
-                product_names.append(product_existence_check)
-            else:
-                response['error'] = f'Product {product["product_name"]} appeared more than once in the body.'
-                return response
+    if error:
+        response['error'] = error
+        response['product_details'] = product
+        return response
 
-            if 'product_name' not in product or 'description' not in product or 'product_category' not in product or 'price' not in product or 'discount' not in product or 'in_stock' not in product:
-                response['error'] = 'A key is missing.'
-                response['product_details'] = product
-                return response
+    existing_products = find_existing_products(db, body['products'])
 
-    creation_data = {}
-    creation_data['created_at'] = datetime.now()
-    creation_data['created_by'] = g.user['username']
-    creation_data['total_sold'] = 0
+    if existing_products:
+        product_name, _ = existing_products.pop()
+        response['error'] = f'Product {product_name} already exists.'
+        return response
 
-    for product in body['products']:
-        product.update(creation_data)
-        product['product_id'] = str(uuid.uuid4())
+    with db:
+        insert_products(db, body['products'], datetime.now(), g.user['username'])
 
-        check_product_name = db.execute(
-            'SELECT product_name FROM product '
-            'WHERE product_name = ? '
-            'LIMIT 1',
-            (product['product_name'],)
-        ).fetchall()
+    get_catalog_cache().invalidate()
 
-        check_product_description = db.execute(
-            'SELECT description FROM product '
-            'WHERE description = ? '
-            'LIMIT 1',
-            (product['description'],)
-        ).fetchall()
+    response['total_inserted_products'] = len(body['products'])
+    response['inserted_products'] = body['products']
+    response['isSuccess'] = True
+    return response
 
-        if len(check_product_name) != 0 and len(check_product_description) != 0:
-            response['error'] = f'Product {check_product_name[0]["product_name"]} already exists.'
-            return response
 
-        try:
-            db.execute(
-                f'INSERT INTO product (product_id, product_name, description, product_category, price, discount, created_at, created_by, in_stock, total_sold) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
-                (
-                    product['product_id'],
-                    product['product_name'],
-                    product['description'],
-                    product['product_category'],
-                    product['price'],
-                    product['discount'],
-                    product['created_at'],
-                    product['created_by'],
-                    product['in_stock'],
-                    product['total_sold']
-                ),
-            )
-            db.commit()
+def find_product_ids(db, product_ids):
+    """Return the subset of ``product_ids`` that exist in the catalog."""
+    existing_ids = set()
 
-        except db.IntegrityError:
-            response['message'] = f'Product {product["product_name"]} already exists.'
-            pass
+    for chunk in chunked(set(product_ids)):
+        placeholders = ', '.join('?' * len(chunk))
 
-        if 'tags' in product:
-            for tag in product['tags']:
-                try:
-                    db.execute(
-                        f'INSERT INTO product_tags (tag_name, created_at, created_by) VALUES (?, ?, ?)',
-                        (
-                            tag,
-                            creation_data['created_at'],
-                            creation_data['created_by']
-                        ),
-                    )
-                    db.commit()
-                except db.IntegrityError:
-                    pass
-
-                db.execute(
-                    f'INSERT INTO product_by_tag (tag_name, product_id) VALUES (?, ?)',
-                    (
-                        tag,
-                        product['product_id'],
-                    ),
-                )
-                db.commit()
+        products = db.execute(
+            'SELECT product_id FROM product '
+            f'WHERE product_id IN ({placeholders})',
+            chunk
+        ).fetchall()
 
-    response['total_inserted_products'] = len(body['products'])
-    response['inserted_products'] = body['products']
-    response['isSuccess'] = True
-    return response
+        existing_ids.update(product['product_id'] for product in products)
 
+    return existing_ids
 
-@bp.route('/delete-product/<product_id>', methods=['DELETE'])
-@login_required
-@authorization_required
-def delete_product(product_id):
-    response = {
-        'isSuccess': False,
-        'message': 'Delete a product'
-    }
 
-    db = get_db()
+def delete_products(db, product_ids):
+    """Delete products and every row referencing them. The caller owns the transaction."""
+    rows = [(product_id,) for product_id in product_ids]
 
-    db.execute(
+    db.executemany(
         'DELETE FROM product_by_cart '
         'WHERE product_id = ?',
-        (product_id,)
+        rows
     )
-    db.commit()
 
-    db.execute(
+    db.executemany(
         'DELETE FROM product_wishlist '
         'WHERE product_id = ?',
-        (product_id,)
+        rows
     )
-    db.commit()
 
-    db.execute(
+    db.executemany(
         'DELETE FROM product_by_tag '
         'WHERE product_id = ?',
-        (product_id,)
+        rows
     )
-    db.commit()
 
-    db.execute(
+    db.executemany(
         'DELETE FROM product '
         'WHERE product_id = ?',
-        (product_id,)
+        rows
     )
-    db.commit()
-
-    response['isSuccess'] = True
-    return response
 
 
-@bp.route('/update-product/<product_id>', methods=['PUT'])
+@bp.route('/delete-product/<product_id>', methods=['DELETE'])
 @login_required
 @authorization_required
-def update_product(product_id):
+def delete_product(product_id):
     response = {
         'isSuccess': False,
-        'operation': 'Update product'
+        'message': 'Delete a product'
     }
 
     db = get_db()
 
-    update_body = dict(request.get_json())
+    with db:
+        delete_products(db, [product_id])
 
+    get_catalog_cache().invalidate([product_id])
+    cart_cache.clear()
+
+    response['isSuccess'] = True
+    return response
+
+
+def validate_product_update(update_body):
+    """Return an error message for an invalid update body, or None."""
     for key in update_body:
-        if key not in ['product_name', 'description', 'product_category', 'price', 'discount', 'in_stock', 'tags']:
-            response['error'] = 'Wrong key provided.'
-            return response
+        if key not in UPDATABLE_PRODUCT_COLUMNS + ['tags']:
+            return 'Wrong key provided.'
 
         if key in ['product_name', 'description', 'product_category']:
             if type(update_body[key]) != str:
-                response['error'] = f'Wrong type for {key}.'
-                return response
+                return f'Wrong type for {key}.'
 
         if key in ['price', 'discount']:
             if type(update_body[key]) not in [int, float]:
-                response['error'] = f'Wrong type for {key}.'
-                return response
+                return f'Wrong type for {key}.'
 
         if key == 'in_stock':
             if type(update_body[key]) != int:
-                response['error'] = 'Wrong type for product_name.'
-                return response
+                return 'Wrong type for in_stock.'
 
         if key == 'tags':
             if type(update_body[key]) != list:
-                response['error'] = 'Wrong type for tags.'
-                return response
+                return 'Wrong type for tags.'
 
-    body = db.execute(
-        'SELECT * FROM product '
-        'WHERE product_id = ? '
-        'LIMIT 1',
-        (product_id,)
-    ).fetchall()
+    return None
 
-    if len(body) == 0:
-        response['error'] = f'No such product with the id = {product_id}'
-        return response
 
-    db.execute(
-        'DELETE FROM product '
+def update_product_columns(db, product_id, update_body, updated_at, updated_by):
+    """Update only the columns present in ``update_body``. Returns False for an unknown product."""
+    columns = [column for column in UPDATABLE_PRODUCT_COLUMNS if column in update_body]
+    set_clause = ', '.join(f'{column} = ?' for column in columns + ['updated_at', 'updated_by'])
+    values = [update_body[column] for column in columns] + [updated_at, updated_by, product_id]
+
+    updated = db.execute(
+        f'UPDATE product SET {set_clause} '
         'WHERE product_id = ?',
-        (product_id,)
+        values
+    ).rowcount
+
+    return updated != 0
+
+
+def set_product_tags(db, tags_by_product, created_at, created_by):
+    """Replace the tags of each product, writing only the links that changed."""
+    current_tags = get_tags_by_product(db, list(tags_by_product))
+    added_tags = []
+    removed_tags = []
+
+    for product_id, tags in tags_by_product.items():
+        added_tags += [(tag, product_id) for tag in set(tags) - set(current_tags[product_id])]
+        removed_tags += [(tag, product_id) for tag in set(current_tags[product_id]) - set(tags)]
+
+    db.executemany(
+        'INSERT OR IGNORE INTO product_tags (tag_name, created_at, created_by) VALUES (?, ?, ?)',
+        [(tag, created_at, created_by) for tag in {tag for tag, _ in added_tags}]
     )
-    db.commit()
 
-    db.execute(
+    db.executemany(
         'DELETE FROM product_by_tag '
-        'WHERE product_id = ?',
-        (product_id,)
+        'WHERE tag_name = ? AND product_id = ?',
+        removed_tags
     )
-    db.commit()
 
-    body = dict(body[0])
+    db.executemany(
+        'INSERT INTO product_by_tag (tag_name, product_id) VALUES (?, ?)',
+        added_tags
+    )
 
-    update_data = {}
-    update_data['updated_at'] = datetime.now()
-    update_data['updated_by'] = g.user['username']
 
-    body.update(update_body)
-    body.update(update_data)
+@bp.route('/update-product/<product_id>', methods=['PUT'])
+@login_required
+@authorization_required
+def update_product(product_id):
+    response = {
+        'isSuccess': False,
+        'operation': 'Update product'
+    }
 
-    try:
-        db.execute(
-            f'INSERT INTO product (product_id, product_name, description, product_category, price, discount, created_at, created_by, updated_at, updated_by, in_stock, total_sold) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
-            (
-                body['product_id'],
-                body['product_name'],
-                body['description'],
-                body['product_category'],
-                body['price'],
-                body['discount'],
-                body['created_at'],
-                body['created_by'],
-                body['updated_at'],
-                body['updated_by'],
-                body['in_stock'],
-                body['total_sold']
-            ),
-        )
-        db.commit()
-    except db.IntegrityError:
-        response['error'] = f'Product {body["product_name"]} already exists.'
+    db = get_db()
+
+    update_body = dict(request.get_json())
+
+    error = validate_product_update(update_body)
+
+    if error:
+        response['error'] = error
         return response
 
+    updated_at = datetime.now()
+    updated_by = g.user['username']
+
+    with db:
+        if not update_product_columns(db, product_id, update_body, updated_at, updated_by):
+            response['error'] = f'No such product with the id = {product_id}'
+            return response
+
+        if 'tags' in update_body:
+            set_product_tags(db, {product_id: update_body['tags']}, updated_at, updated_by)
+
+    get_catalog_cache().invalidate([product_id])
+
+    # Carts show these columns; other workers notice the price revision.
+    if any(column in update_body for column in CART_PRICE_COLUMNS):
+        cart_cache.clear()
+
+    body = dict(db.execute(
+        'SELECT * FROM product '
+        'WHERE product_id = ?',
+        (product_id,)
+    ).fetchone())
+
     if 'tags' in update_body:
-        for tag in update_body['tags']:
-            try:
-                db.execute(
-                    f'INSERT INTO product_tags (tag_name, created_at, created_by) VALUES (?, ?, ?)',
-                    (
-                        tag,
-                        update_data['updated_at'],
-                        update_data['updated_by']
-                    ),
-                )
-                db.commit()
-            except db.IntegrityError:
-                pass
+        body['tags'] = update_body['tags']
 
-            db.execute(
-                f'INSERT INTO product_by_tag (tag_name, product_id) VALUES (?, ?)',
-                (
-                    tag,
-                    product_id,
-                ),
+    response['updated_products'] = body
+    response['isSuccess'] = True
+    return response
+
+
+@bp.route('/bulk-update', methods=['PUT'])
+@login_required
+@authorization_required
+def bulk_update_products():
+    response = {
+        'isSuccess': False,
+        'operation': 'Bulk update products'
+    }
+
+    db = get_db()
+
+    body = dict(request.get_json())
+
+    if 'products' not in body or type(body['products']) != list:
+        response['error'] = 'products key should be a list or array'
+        return response
+
+    outcomes = []
+    patches = {}
+
+    for patch in body['products']:
+        if type(patch) != dict or type(patch.get('product_id')) != str:
+            outcomes.append({'product_id': None, 'isSuccess': False, 'error': 'product_id missing.'})
+            continue
+
+        product_id = patch['product_id']
+        update_body = {key: value for key, value in patch.items() if key != 'product_id'}
+        error = validate_product_update(update_body)
+
+        if error is None and product_id in patches:
+            error = f'Product {product_id} appeared more than once in the body.'
+
+        outcomes.append({'product_id': product_id, 'isSuccess': error is None, 'error': error})
+
+        if error is None:
+            patches[product_id] = update_body
+
+    existing_ids = find_product_ids(db, patches)
+
+    for outcome in outcomes:
+        if outcome['isSuccess'] and outcome['product_id'] not in existing_ids:
+            outcome['isSuccess'] = False
+            outcome['error'] = f'No such product with the id = {outcome["product_id"]}'
+            patches.pop(outcome['product_id'], None)
+
+    # Patches setting the same columns share one executemany.
+    patches_by_columns = {}
+
+    for product_id, update_body in patches.items():
+        columns = tuple(column for column in UPDATABLE_PRODUCT_COLUMNS if column in update_body)
+        patches_by_columns.setdefault(columns, []).append((product_id, update_body))
+
+    updated_at = datetime.now()
+    updated_by = g.user['username']
+
+    with db:
+        for columns, column_patches in patches_by_columns.items():
+            set_clause = ', '.join(f'{column} = ?' for column in columns + ('updated_at', 'updated_by'))
+
+            db.executemany(
+                f'UPDATE product SET {set_clause} '
+                'WHERE product_id = ?',
+                [
+                    [update_body[column] for column in columns] + [updated_at, updated_by, product_id]
+                    for product_id, update_body in column_patches
+                ]
             )
-            db.commit()
 
-    response['updated_products'] = body
+        set_product_tags(
+            db,
+            {product_id: update_body['tags'] for product_id, update_body in patches.items() if 'tags' in update_body},
+            updated_at,
+            updated_by
+        )
+
+    get_catalog_cache().invalidate(list(patches))
+
+    if any(column in update_body for update_body in patches.values() for column in CART_PRICE_COLUMNS):
+        cart_cache.clear()
+
+    for outcome in outcomes:
+        if outcome['error'] is None:
+            outcome.pop('error')
+
+    response['total_updated_products'] = len(patches)
+    response['products'] = outcomes
     response['isSuccess'] = True
     return response
 
 
-@bp.route('/all-products', methods=['GET'])
+@bp.route('/bulk-delete', methods=['DELETE'])
 @login_required
-def all_products():
+@authorization_required
+def bulk_delete_products():
+    response = {
+        'isSuccess': False,
+        'operation': 'Bulk delete products'
+    }
+
     db = get_db()
 
-    username = g.user['username']
+    body = dict(request.get_json())
 
-    get_role = db.execute(
-        'SELECT role FROM user '
-        'WHERE username = ?',
-        (username,)
-    ).fetchall()
+    if 'product_ids' not in body or type(body['product_ids']) != list:
+        response['error'] = 'product_ids key should be a list or array'
+        return response
 
-    user_role = dict(get_role[0])['role']
+    existing_ids = find_product_ids(db, [product_id for product_id in body['product_ids'] if type(product_id) == str])
+    outcomes = []
 
-    if user_role == 'admin':
+    for product_id in body['product_ids']:
+        if type(product_id) != str:
+            outcomes.append({'product_id': None, 'isSuccess': False, 'error': 'product_id should be a string.'})
+        elif product_id in existing_ids:
+            outcomes.append({'product_id': product_id, 'isSuccess': True})
+        else:
+            outcomes.append({'product_id': product_id, 'isSuccess': False, 'error': f'No such product with the id = {product_id}'})
+
+    with db:
+        delete_products(db, existing_ids)
+
+    get_catalog_cache().invalidate(existing_ids)
+
+    if existing_ids:
+        cart_cache.clear()
+
+    response['total_deleted_products'] = len(existing_ids)
+    response['products'] = outcomes
+    response['isSuccess'] = True
+    return response
+
+
+def load_customer_listing(db, limit, cursor):
+    """Return one page of in stock products, best sellers first, as dicts."""
+    if cursor is None:
         products = db.execute(
-            'SELECT * FROM product '
-            'ORDER BY created_at ASC'
+            'SELECT product_id, product_name, description, product_category, price, discount, total_sold FROM product '
+            'WHERE in_stock > 0 '
+            'ORDER BY total_sold DESC, product_id ASC '
+            'LIMIT ?',
+            (sql_limit(limit),)
         ).fetchall()
 
     else:
         products = db.execute(
-            'SELECT product_id, product_name, description, product_category, price, discount FROM product '
-            'WHERE in_stock > 0 '
-            'ORDER BY total_sold DESC'
+            'SELECT product_id, product_name, description, product_category, price, discount, total_sold FROM product '
+            'WHERE in_stock > 0 AND total_sold <= ? AND (total_sold < ? OR product_id > ?) '
+            'ORDER BY total_sold DESC, product_id ASC '
+            'LIMIT ?',
+            (cursor[0], cursor[0], cursor[1], sql_limit(limit))
         ).fetchall()
 
-    results = []
+    return [dict(product) for product in products]
 
-    for i in products:
-        formatted_data = dict(i)
 
-        get_product_tags = db.execute(
-            'SELECT tag_name FROM product_by_tag '
-            'WHERE product_id = ?',
-            (formatted_data['product_id'],)
+@bp.route('/all-products', methods=['GET'])
+@login_required
+@catalog_conditional_get
+@customer_catalog_snapshot
+def all_products():
+    response = {
+        'isSuccess': False,
+        'operation': 'Get all products'
+    }
+
+    db = get_db()
+
+    user_role = g.user['role']
+
+    if user_role == 'admin':
+        allowed_fields = PRODUCT_COLUMNS + ['tags']
+        cursor_columns = ['created_at', 'product_id']
+    else:
+        allowed_fields = CUSTOMER_PRODUCT_COLUMNS
+        cursor_columns = ['total_sold', 'product_id']
+
+    try:
+        limit, cursor = get_page_args(len(cursor_columns))
+        fields = get_fields(allowed_fields)
+    except ValueError as error:
+        response['error'] = str(error)
+        return response
+
+    if user_role == 'admin':
+        if cursor is None:
+            cursor = ['', '']
+
+        products = db.execute(
+            'SELECT * FROM product '
+            'WHERE created_at >= ? AND (created_at > ? OR product_id > ?) '
+            'ORDER BY created_at ASC, product_id ASC '
+            'LIMIT ?',
+            (cursor[0], cursor[0], cursor[1], sql_limit(limit))
         ).fetchall()
 
-        if user_role == 'admin':
-            formatted_data['tags'] = []
+    else:
+        catalog_cache = get_catalog_cache()
+        products = catalog_cache.get(
+            catalog_cache.listing_key('all-products', limit, cursor),
+            lambda: load_customer_listing(db, limit, cursor)
+        )
+
+    products, next_cursor = paginate(products, limit, cursor_columns)
+    results = project(products, fields)
 
-            for tag in get_product_tags:
-                formatted_data['tags'].append(dict(tag)['tag_name'])
+    if 'tags' in fields:
+        tags_by_product = get_cached_tags_by_product(db, [product['product_id'] for product in products])
 
-        results.append(formatted_data)
+        for product, result in zip(products, results):
+            result['tags'] = tags_by_product[product['product_id']]
 
     return jsonify({
         'isSuccess': True,
         'total_products': len(results),
-        'products': results
+        'products': results,
+        'next_cursor': next_cursor
     })
 
 
+def load_customer_product(db, product_id):
+    """Return the product as customers see it, or False when it is missing or out of stock."""
+    product = db.execute(
+        'SELECT product_id, product_name, description, product_category, price, discount FROM product '
+        'WHERE product_id = ? AND in_stock > 0 '
+        'LIMIT 1',
+        (product_id,)
+    ).fetchone()
+
+    return dict(product) if product is not None else False
+
+
 @bp.route('/product-details/<product_id>', methods=['GET'])
 @login_required
+@catalog_conditional_get
 def product_details(product_id):
     response = {
         'isSuccess': False,
@@ -357,15 +670,7 @@ def product_details(product_id):
 
     db = get_db()
 
-    username = g.user['username']
-
-    get_role = db.execute(
-        'SELECT role FROM user '
-        'WHERE username = ?',
-        (username,)
-    ).fetchall()
-
-    user_role = dict(get_role[0])['role']
+    user_role = g.user['role']
 
     if user_role == 'admin':
         products = db.execute(
@@ -376,12 +681,8 @@ def product_details(product_id):
         ).fetchall()
 
     else:
-        products = db.execute(
-            'SELECT product_id, product_name, description, product_category, price, discount FROM product '
-            'WHERE product_id = ? AND in_stock > 0 '
-            'LIMIT 1',
-            (product_id,)
-        ).fetchall()
+        product = get_catalog_cache().get('product:' + product_id, lambda: load_customer_product(db, product_id))
+        products = [product] if product else []
 
     if len(products) == 0:
         response['error'] = f'No such product with the id = {product_id}'
@@ -390,34 +691,23 @@ def product_details(product_id):
     result = dict(products[0])
 
     if user_role == 'admin':
-        get_product_tags = db.execute(
-            'SELECT tag_name FROM product_by_tag '
-            'WHERE product_id = ?',
-            (product_id,)
-        ).fetchall()
-
         get_orders = db.execute(
-            'SELECT oi.order_id, pbc.quantity, sci.username FROM order_info AS oi '
-            'JOIN product_by_cart AS pbc '
-            'ON oi.order_id = pbc.cart_id '
-            'JOIN shopping_cart_info AS sci '
-            'ON pbc.cart_id = sci.cart_id '
-            'WHERE pbc.product_id = ?',
+            'SELECT ol.order_id, ol.quantity, oi.username FROM order_lines AS ol '
+            'JOIN order_info AS oi '
+            'ON oi.order_id = ol.order_id '
+            'WHERE ol.product_id = ?',
             (product_id,)
         ).fetchall()
 
-        result['tags'] = []
+        result['tags'] = get_cached_tags_by_product(db, [product_id])[product_id]
         result['orders'] = []
 
-        for tag in get_product_tags:
-            result['tags'].append(dict(tag)['tag_name'])
-
         for order in get_orders:
             result['orders'].append(
                 {
-                    dict(order)['order_id']: {
-                        'username': dict(order)['username'],
-                        'quantity': dict(order)['quantity']
+                    order['order_id']: {
+                        'username': order['username'],
+                        'quantity': order['quantity']
                     }
                 }
             )
@@ -484,7 +774,6 @@ def remove_product_from_wishlist(product_id):
     check_wishlist = db.execute(
         'SELECT * FROM product_wishlist '
         'WHERE username = ? AND product_id = ? '
-        'ORDER BY created_at DESC '
         'LIMIT 1',
         (username, product_id)
     ).fetchall()
@@ -507,90 +796,116 @@ def remove_product_from_wishlist(product_id):
 @bp.route('/wishlist-products', methods=['GET'])
 @login_required
 def wishlist_products():
+    response = {
+        'isSuccess': False,
+        'operation': 'Get wishlist products'
+    }
+
     db = get_db()
     username = g.user['username']
 
+    try:
+        limit, cursor = get_page_args(1)
+        fields = get_fields(CUSTOMER_PRODUCT_COLUMNS)
+    except ValueError as error:
+        response['error'] = str(error)
+        return response
+
+    if cursor is None:
+        cursor = ['']
+
     products = db.execute(
-        'SELECT product_id, product_name, description, product_category, price, discount FROM product '
-        'WHERE product_id IN (SELECT DISTINCT product_id FROM product_wishlist WHERE username = ?)',
-        (username,)
+        'SELECT p.product_id, p.product_name, p.description, p.product_category, p.price, p.discount FROM product_wishlist AS pw '
+        'JOIN product AS p '
+        'ON p.product_id = pw.product_id '
+        'WHERE pw.username = ? AND pw.product_id > ? '
+        'ORDER BY pw.product_id ASC '
+        'LIMIT ?',
+        (username, cursor[0], sql_limit(limit))
     ).fetchall()
 
-    results = []
-
-    for i in products:
-        results.append(dict(i))
+    products, next_cursor = paginate(products, limit, ['product_id'])
+    results = project(products, fields)
 
     return jsonify({
         'isSuccess': True,
         'total_products': len(results),
-        'products': results
+        'products': results,
+        'next_cursor': next_cursor
     })
 
 
+def search_catalog(db, columns, match_query, limit, cursor):
+    if cursor is None:
+        cursor_filter = ''
+        values = (match_query, sql_limit(limit))
+    else:
+        cursor_filter = 'WHERE s.score > ? OR (s.score = ? AND p.product_id > ?) '
+        values = (match_query, cursor[0], cursor[0], cursor[1], sql_limit(limit))
+
+    # bm25() is lower for better matches; name hits weigh more than tag hits.
+    return db.execute(
+        f'SELECT {columns}, s.score FROM ('
+        '    SELECT rowid, bm25(product_search, 10.0, 5.0, 2.0, 2.0) AS score FROM product_search '
+        '    WHERE product_search MATCH ?'
+        ') AS s '
+        'JOIN product AS p '
+        'ON p.rowid = s.rowid '
+        f'{cursor_filter}'
+        'ORDER BY s.score ASC, p.product_id ASC '
+        'LIMIT ?',
+        values
+    ).fetchall()
+
+
 @bp.route('/search-products', methods=['GET'])
 @login_required
+@catalog_conditional_get
 def search_products():
-    db = get_db()
+    response = {
+        'isSuccess': False,
+        'operation': 'Search products'
+    }
 
-    username = g.user['username']
+    db = get_db()
 
-    search_term = request.args.get('q')
+    search_terms = re.findall(r'\w+', request.args.get('q', '').lower())
 
-    if ' ' in search_term:
-        search_term_formatted = search_term.replace(' ', '%')
-        search_term_formatted = f'%{search_term_formatted}%'
-        print(search_term_formatted)
+    if len(search_terms) == 0:
+        response['error'] = 'Search term missing.'
+        return response
 
-    else:
-        search_term = search_term[1: len(search_term) - 1]
-        search_term_formatted = f'%{search_term}%'
+    # Every term must match, each as a prefix: "gra card" finds "Graphics Card".
+    match_query = ' '.join(f'"{term}"*' for term in search_terms)
 
-    get_role = db.execute(
-        'SELECT role FROM user '
-        'WHERE username = ?',
-        (username,)
-    ).fetchall()
+    user_role = g.user['role']
 
-    user_role = dict(get_role[0])['role']
+    try:
+        limit, cursor = get_page_args(2)
+        fields = get_fields(PRODUCT_COLUMNS if user_role == 'admin' else CUSTOMER_PRODUCT_COLUMNS)
+    except ValueError as error:
+        response['error'] = str(error)
+        return response
 
     if user_role == 'admin':
-        products_query = f'''
-            SELECT * FROM product 
-            WHERE LOWER(product_name) LIKE ? OR LOWER(description) LIKE ? OR LOWER(product_category) LIKE ? OR 
-            product_id IN ( 
-               SELECT product_id FROM product_by_tag WHERE tag_name LIKE ? 
-           )
-        '''
-
-        print(products_query)
-
-        products = db.execute(
-            products_query, (search_term_formatted, search_term_formatted, search_term_formatted, search_term_formatted)
-        ).fetchall()
-
+        products = search_catalog(db, 'p.*', match_query, limit, cursor)
     else:
-        products_query = f'''
-            SELECT product_id, product_name, description, product_category, price, discount FROM product 
-            WHERE LOWER(product_name) LIKE ? OR LOWER(description) LIKE ? OR LOWER(product_category) LIKE ? OR 
-            product_id IN ( 
-               SELECT product_id FROM product_by_tag WHERE tag_name LIKE ? 
-           )
-        '''
-
-        print(products_query)
-
-        products = db.execute(
-            products_query, (search_term_formatted, search_term_formatted, search_term_formatted, search_term_formatted)
-        ).fetchall()
-
-    results = []
+        catalog_cache = get_catalog_cache()
+        products = catalog_cache.get(
+            catalog_cache.listing_key('search-products', match_query, limit, cursor),
+            lambda: [
+                dict(product) for product in search_catalog(
+                    db, 'p.product_id, p.product_name, p.description, p.product_category, p.price, p.discount', match_query, limit, cursor
+                )
+            ]
+        )
 
-    for i in products:
-        results.append(dict(i))
+    products, next_cursor = paginate(products, limit, ['score', 'product_id'])
+    results = project(products, fields)
 
     return jsonify({
         'isSuccess': True,
         'total_products': len(results),
-        'products': results
+        'products': results,
+        'next_cursor': next_cursor
     })
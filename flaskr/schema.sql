@@ -1,6 +1,7 @@
 DROP TABLE IF EXISTS user;
 DROP TABLE IF EXISTS products;
 DROP TABLE IF EXISTS product;
+DROP TABLE IF EXISTS product_search;
 DROP TABLE IF EXISTS product_tags;
 DROP TABLE IF EXISTS product_by_tag;
 DROP TABLE IF EXISTS product_wishlist;
@@ -10,6 +11,14 @@ DROP TABLE IF EXISTS products_by_cart;
 DROP TABLE IF EXISTS product_by_cart;
 DROP TABLE IF EXISTS shipper;
 DROP TABLE IF EXISTS order_info;
+DROP TABLE IF EXISTS order_lines;
+DROP TABLE IF EXISTS sales_by_day;
+DROP TABLE IF EXISTS sales_by_product;
+DROP TABLE IF EXISTS sales_by_category;
+DROP TABLE IF EXISTS sales_by_shipper;
+DROP TABLE IF EXISTS schema_version;
+DROP TABLE IF EXISTS catalog_revision;
+DROP TABLE IF EXISTS product_change;
 
 DROP TABLE IF EXISTS shopping_cart_info;
 DROP TABLE IF EXISTS orders;
@@ -71,8 +80,10 @@ CREATE TABLE product_wishlist (
 CREATE TABLE shopping_cart_info (
     cart_id TEXT,
     username TEXT,
+    status TEXT,
     created_at TIMESTAMP,
     updated_at TIMESTAMP,
+    version INTEGER NOT NULL DEFAULT 0,
     PRIMARY KEY(cart_id),
     FOREIGN KEY (username) REFERENCES user(username)
 );
@@ -97,20 +108,221 @@ CREATE TABLE shipper (
     PRIMARY KEY(shipper_id)
 );
 
+-- Migrations in flaskr/migrations applied to this database, see `flask migrate`.
+CREATE TABLE schema_version (
+    version INTEGER,
+    name TEXT,
+    applied_at TIMESTAMP,
+    PRIMARY KEY(version)
+);
+
 CREATE TABLE order_info (
     order_id TEXT,
+    username TEXT,
     created_at TIMESTAMP,
     payment_method TEXT,
     delivery_address TEXT,
     shipper_id TEXT,
     date_shipped TIMESTAMP,
     shipment_created_by TEXT,
+    order_total FLOAT,
     PRIMARY KEY(order_id),
     FOREIGN KEY (order_id) REFERENCES shopping_cart_info(cart_id),
+    FOREIGN KEY (username) REFERENCES user(username),
     FOREIGN KEY (shipper_id) REFERENCES shipper(shipper_id)
 );
 
+-- Snapshot of each ordered line at checkout time, so order history does
+-- not change when product prices do.
+CREATE TABLE order_lines (
+    order_id TEXT,
+    product_id TEXT,
+    product_name TEXT,
+    product_category TEXT,
+    quantity INTEGER,
+    unit_price FLOAT,
+    discount FLOAT,
+    line_total FLOAT,
+    PRIMARY KEY(order_id, product_id),
+    FOREIGN KEY (order_id) REFERENCES order_info(order_id),
+    FOREIGN KEY (product_id) REFERENCES product(product_id)
+);
+
+-- Sales rollups, updated incrementally by checkout and shipment and
+-- recomputed by `flask rebuild-analytics`.
+CREATE TABLE sales_by_day (
+    day TEXT,
+    orders INTEGER,
+    units INTEGER,
+    revenue FLOAT,
+    PRIMARY KEY(day)
+);
+
+CREATE TABLE sales_by_product (
+    product_id TEXT,
+    product_name TEXT,
+    units INTEGER,
+    revenue FLOAT,
+    PRIMARY KEY(product_id)
+);
+
+CREATE TABLE sales_by_category (
+    product_category TEXT,
+    units INTEGER,
+    revenue FLOAT,
+    PRIMARY KEY(product_category)
+);
+
+CREATE TABLE sales_by_shipper (
+    shipper_id TEXT,
+    orders INTEGER,
+    revenue FLOAT,
+    PRIMARY KEY(shipper_id)
+);
+
+CREATE VIRTUAL TABLE product_search USING fts5(
+    product_name,
+    description,
+    product_category,
+    tags
+);
+
+-- product_search rows share the rowid of their product row and are kept in
+-- sync by the triggers below, whichever code path writes the catalog.
+CREATE TRIGGER product_search_insert AFTER INSERT ON product BEGIN
+    INSERT INTO product_search (rowid, product_name, description, product_category, tags)
+    VALUES (
+        NEW.rowid,
+        NEW.product_name,
+        NEW.description,
+        NEW.product_category,
+        (SELECT group_concat(tag_name, ' ') FROM product_by_tag WHERE product_id = NEW.product_id)
+    );
+END;
+
+CREATE TRIGGER product_search_update AFTER UPDATE OF product_name, description, product_category ON product BEGIN
+    UPDATE product_search SET product_name = NEW.product_name, description = NEW.description, product_category = NEW.product_category
+    WHERE rowid = NEW.rowid;
+END;
+
+CREATE TRIGGER product_search_delete AFTER DELETE ON product BEGIN
+    DELETE FROM product_search WHERE rowid = OLD.rowid;
+END;
+
+CREATE TRIGGER product_search_tag_insert AFTER INSERT ON product_by_tag BEGIN
+    UPDATE product_search SET tags = (SELECT group_concat(tag_name, ' ') FROM product_by_tag WHERE product_id = NEW.product_id)
+    WHERE rowid = (SELECT rowid FROM product WHERE product_id = NEW.product_id);
+END;
+
+CREATE TRIGGER product_search_tag_delete AFTER DELETE ON product_by_tag BEGIN
+    UPDATE product_search SET tags = (SELECT group_concat(tag_name, ' ') FROM product_by_tag WHERE product_id = OLD.product_id)
+    WHERE rowid = (SELECT rowid FROM product WHERE product_id = OLD.product_id);
+END;
+
+-- Bumped by every write to the catalog, whichever code path makes it. The
+-- catalog endpoints derive their ETag and Last-Modified from this row.
+CREATE TABLE catalog_revision (
+    id INTEGER PRIMARY KEY,
+    revision INTEGER,
+    updated_at INTEGER,
+    price_revision INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT INTO catalog_revision (id, revision, updated_at) VALUES (1, 0, CAST(strftime('%s', 'now') AS INTEGER));
+
+CREATE TRIGGER catalog_revision_product_insert AFTER INSERT ON product BEGIN
+    UPDATE catalog_revision SET revision = revision + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER) WHERE id = 1;
+END;
+
+CREATE TRIGGER catalog_revision_product_update AFTER UPDATE ON product BEGIN
+    UPDATE catalog_revision SET revision = revision + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER) WHERE id = 1;
+END;
+
+CREATE TRIGGER catalog_revision_product_delete AFTER DELETE ON product BEGIN
+    UPDATE catalog_revision SET revision = revision + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER) WHERE id = 1;
+END;
+
+-- Bumped only by writes that change what a cart line shows, so cached carts
+-- survive the stock updates of every checkout.
+CREATE TRIGGER catalog_price_revision_update AFTER UPDATE OF product_name, price, discount ON product BEGIN
+    UPDATE catalog_revision SET price_revision = price_revision + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER catalog_price_revision_delete AFTER DELETE ON product BEGIN
+    UPDATE catalog_revision SET price_revision = price_revision + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER catalog_revision_tag_insert AFTER INSERT ON product_by_tag BEGIN
+    UPDATE catalog_revision SET revision = revision + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER) WHERE id = 1;
+END;
+
+CREATE TRIGGER catalog_revision_tag_delete AFTER DELETE ON product_by_tag BEGIN
+    UPDATE catalog_revision SET revision = revision + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER) WHERE id = 1;
+END;
+
+-- One row per write that changes a product or tag list the catalog cache
+-- may hold, so a worker can forget just those products. Stock updates
+-- only count when the product goes in or out of stock. Older rows are
+-- pruned; a worker that fell further behind drops its whole cache.
+CREATE TABLE product_change (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_id TEXT
+);
+
+CREATE TRIGGER product_change_update AFTER UPDATE ON product
+WHEN NEW.product_name IS NOT OLD.product_name
+    OR NEW.description IS NOT OLD.description
+    OR NEW.product_category IS NOT OLD.product_category
+    OR NEW.price IS NOT OLD.price
+    OR NEW.discount IS NOT OLD.discount
+    OR (NEW.in_stock > 0) IS NOT (OLD.in_stock > 0)
+BEGIN
+    INSERT INTO product_change (product_id) VALUES (NEW.product_id);
+END;
+
+CREATE TRIGGER product_change_delete AFTER DELETE ON product BEGIN
+    INSERT INTO product_change (product_id) VALUES (OLD.product_id);
+END;
+
+CREATE TRIGGER product_change_tag_insert AFTER INSERT ON product_by_tag BEGIN
+    INSERT INTO product_change (product_id) VALUES (NEW.product_id);
+END;
+
+CREATE TRIGGER product_change_tag_delete AFTER DELETE ON product_by_tag BEGIN
+    INSERT INTO product_change (product_id) VALUES (OLD.product_id);
+END;
+
+CREATE TRIGGER product_change_prune AFTER INSERT ON product_change WHEN NEW.seq % 1000 = 0 BEGIN
+    DELETE FROM product_change WHERE seq <= NEW.seq - 10000;
+END;
+
+-- Bumped by every write to a cart's lines, so a worker can tell whether the
+-- cart it cached is still current.
+CREATE TRIGGER cart_version_insert AFTER INSERT ON product_by_cart BEGIN
+    UPDATE shopping_cart_info SET version = version + 1 WHERE cart_id = NEW.cart_id;
+END;
+
+CREATE TRIGGER cart_version_update AFTER UPDATE ON product_by_cart BEGIN
+    UPDATE shopping_cart_info SET version = version + 1 WHERE cart_id = NEW.cart_id;
+END;
+
+CREATE TRIGGER cart_version_delete AFTER DELETE ON product_by_cart BEGIN
+    UPDATE shopping_cart_info SET version = version + 1 WHERE cart_id = OLD.cart_id;
+END;
+
 CREATE INDEX product_name ON product(product_name);
-CREATE INDEX description ON product(description);
+CREATE INDEX product_created_at ON product(created_at, product_id);
+-- The customer listing only shows products in stock.
+CREATE INDEX product_in_stock_total_sold ON product(total_sold DESC, product_id) WHERE in_stock > 0;
+-- At most one cart per user is still being filled; checkout marks it 'ordered'.
+CREATE UNIQUE INDEX shopping_cart_info_active ON shopping_cart_info(username) WHERE status = 'active';
+CREATE INDEX product_by_tag_product_id ON product_by_tag(product_id, tag_name);
+CREATE INDEX product_by_cart_product_id ON product_by_cart(product_id);
+CREATE INDEX product_wishlist_product_id ON product_wishlist(product_id);
+CREATE INDEX order_info_username ON order_info(username, created_at);
+CREATE INDEX order_info_created_at ON order_info(created_at, order_id);
+CREATE INDEX order_lines_product_id ON order_lines(product_id);
+CREATE INDEX sales_by_product_revenue ON sales_by_product(revenue DESC);
+CREATE INDEX sales_by_product_units ON sales_by_product(units DESC);
 
 INSERT INTO user (username, password, role) VALUES ('admin', 'admin', 'admin');
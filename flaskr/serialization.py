@@ -0,0 +1,84 @@
+import sqlite3
+from datetime import date, datetime
+
+from flask.json import JSONEncoder as FlaskJSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def to_json_compatible(obj):
+    """Convert what the JSON encoders do not know about, or raise TypeError."""
+    if isinstance(obj, sqlite3.Row):
+        return dict(zip(obj.keys(), obj))
+
+    if isinstance(obj, datetime) and obj.tzinfo is None:
+        return obj.isoformat(' ', 'microseconds')
+
+    if isinstance(obj, date):
+        return obj.strftime(DATETIME_FORMAT)
+
+    iterable = iter(obj)
+    return list(iterable)
+
+
+class JSONEncoder(FlaskJSONEncoder):
+    """Standard library encoder that writes rows as objects and dates as DATETIME_FORMAT."""
+
+    def default(self, obj):
+        try:
+            return to_json_compatible(obj)
+        except TypeError:
+            return super().default(obj)
+
+
+class OrjsonEncoder(JSONEncoder):
+    """Encodes with orjson, falling back to the standard library for what orjson rejects.
+
+    orjson only writes compact output and leaves non-ASCII text unescaped,
+    so indented output, other separators, and non-ASCII output with
+    JSON_AS_ASCII are left to the standard library. The JSON otherwise
+    differs only in floats: those with an exponent are spelled ``1e16``
+    rather than ``1e+16``, and NaN and infinities are written as ``null``
+    rather than ``NaN`` and ``Infinity``, whatever ``allow_nan`` says.
+    """
+
+    def encode(self, obj):
+        if self.indent is not None or (self.item_separator, self.key_separator) != (',', ':'):
+            return super().encode(obj)
+
+        option = orjson.OPT_PASSTHROUGH_DATETIME
+
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+
+        try:
+            result = orjson.dumps(obj, default=self.default, option=option).decode('utf8')
+        except orjson.JSONEncodeError:
+            return super().encode(obj)
+
+        if self.ensure_ascii and not result.isascii():
+            return super().encode(obj)
+
+        return result
+
+
+def init_app(app):
+    backend = app.config['JSON_BACKEND']
+
+    if backend == 'auto':
+        backend = 'orjson' if orjson is not None else 'json'
+
+    if backend == 'orjson':
+        if orjson is None:
+            raise RuntimeError('JSON_BACKEND = "orjson" needs the orjson package, install flaskr[orjson].')
+
+        app.json_encoder = OrjsonEncoder
+    elif backend == 'json':
+        app.json_encoder = JSONEncoder
+    else:
+        raise RuntimeError(f'Unknown JSON_BACKEND {backend!r}.')
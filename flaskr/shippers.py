@@ -3,12 +3,17 @@ from datetime import datetime
 
 from flask import Blueprint, g, request, jsonify
 
+from flaskr.analytics import record_shipment
 from flaskr.auth import login_required, authorization_required
-from flaskr.db import get_db
+from flaskr.db import get_db, run_in_transaction
 
 bp = Blueprint('shippers', __name__, url_prefix='/shippers')
 
 
+class ShipmentError(Exception):
+    pass
+
+
 @bp.route('/create-shippers', methods=['POST'])
 @login_required
 @authorization_required
@@ -21,6 +26,17 @@ def add_product():
     db = get_db()
 
     body = dict(request.get_json())
+
+    if 'shippers' not in body or type(body['shippers']) != list:
+        response['error'] = 'shippers key should be a list or array'
+        return response
+
+    for shipper in body['shippers']:
+        if type(shipper) != dict or 'shipper_name' not in shipper or 'phone_number' not in shipper:
+            response['error'] = 'A key is missing.'
+            response['shipper_details'] = shipper
+            return response
+
     creation_data = {}
     creation_data['created_at'] = datetime.now()
     creation_data['created_by'] = g.user['username']
@@ -29,21 +45,20 @@ def add_product():
         shipper.update(creation_data)
         shipper['shipper_id'] = str(uuid.uuid4())
 
-        try:
-            db.execute(
-                f'INSERT INTO shipper (shipper_id, shipper_name, phone_number, created_at, created_by) VALUES (?, ?, ?, ?, ?)',
+    with db:
+        db.executemany(
+            f'INSERT INTO shipper (shipper_id, shipper_name, phone_number, created_at, created_by) VALUES (?, ?, ?, ?, ?)',
+            [
                 (
                     shipper['shipper_id'],
                     shipper['shipper_name'],
                     shipper['phone_number'],
                     shipper['created_at'],
                     shipper['created_by']
-                ),
-            )
-            db.commit()
-        except db.IntegrityError:
-            response['message'] = f'Product {shipper["shipper_name"]} already exists.'
-            pass
+                )
+                for shipper in body['shippers']
+            ]
+        )
 
     response['total_inserted_shippers'] = len(body['shippers'])
     response['inserted_shippers'] = body['shippers']
@@ -65,10 +80,12 @@ def create_shipment():
     created_at = datetime.now()
 
     body = dict(request.get_json())
+    order_ids = list(dict.fromkeys(body['order_ids']))
+    revenue = 0
 
-    for order_id in body['order_ids']:
+    for order_id in order_ids:
         check_order = db.execute(
-            'SELECT shipper_id FROM order_info '
+            'SELECT shipper_id, order_total FROM order_info '
             'WHERE order_id = ? '
             'LIMIT 1',
             (order_id,)
@@ -82,13 +99,26 @@ def create_shipment():
             response['error'] = f'Order {order_id} already shipped'
             return response
 
-    for order_id in body['order_ids']:
-        db.execute(
+        revenue += check_order[0]['order_total'] or 0
+
+    def ship(db):
+        shipped = db.executemany(
             'UPDATE order_info SET shipper_id = ?, date_shipped = ?, shipment_created_by = ? '
-            'WHERE order_id = ?',
-            (body['shipper_id'], created_at, username, order_id)
-        )
-        db.commit()
+            'WHERE order_id = ? AND shipper_id IS NULL',
+            [(body['shipper_id'], created_at, username, order_id) for order_id in order_ids]
+        ).rowcount
+
+        # Another request shipped one of the orders since it was checked.
+        if shipped != len(order_ids):
+            raise ShipmentError('An order was already shipped')
+
+        record_shipment(db, body['shipper_id'], len(order_ids), revenue)
+
+    try:
+        run_in_transaction(ship)
+    except ShipmentError as error:
+        response['error'] = str(error)
+        return response
 
     response['isSuccess'] = True
     return response
@@ -104,13 +134,8 @@ def all_shippers():
         'ORDER BY shipper_name ASC'
     ).fetchall()
 
-    results = []
-
-    for i in shippers:
-        results.append(dict(i))
-
     return jsonify({
         'isSuccess': True,
-        'total_products': len(results),
-        'shippers': results
+        'total_products': len(shippers),
+        'shippers': shippers
     })
@@ -1,13 +1,38 @@
+import time
 import uuid
 from datetime import datetime
 
-from flask import Blueprint, g, request
+from flask import Blueprint, current_app, g, request, session
 
 from flaskr.auth import login_required
-from flaskr.db import get_db
+from flaskr.cache import TTLCache
+from flaskr.db import chunked, get_db
 
 bp = Blueprint('shopping_cart', __name__, url_prefix='/shopping-cart')
 
+# ``(cart token, cart version, checked at, cart)`` by username, as served by
+# get-products-in-cart. Each worker keeps its own entries; see get_cart for
+# how they are kept current.
+cart_cache = TTLCache(maxsize=4096, ttl=30)
+
+# The product columns a cart line shows. Writing them bumps the price
+# revision, which every cached cart depends on.
+CART_PRICE_COLUMNS = ['product_name', 'price', 'discount']
+
+
+def touch_cart():
+    """Record in the session that the user's cart changed, so no worker serves it from its cache."""
+    session['cart_token'] = uuid.uuid4().hex[:8]
+
+
+def get_active_cart(db, username):
+    """Return the user's cart that has not been ordered yet, or None."""
+    return db.execute(
+        'SELECT * FROM shopping_cart_info '
+        "WHERE username = ? AND status = 'active'",
+        (username,)
+    ).fetchone()
+
 
 @bp.route('/add-to-cart', methods=["POST"])
 @login_required
@@ -20,197 +45,201 @@ def create_shopping_cart():
     db = get_db()
     username = g.user['username']
     created_at = datetime.now()
-    is_new_cart = False
 
-    check_shopping_cart = db.execute(
-        'SELECT * FROM shopping_cart_info '
-        'WHERE username = ? '
-        'ORDER BY created_at DESC '
-        'LIMIT 1',
-        (username,)
-    ).fetchall()
+    body = request.get_json()
 
-    if len(check_shopping_cart) == 0:
-        cart_id = str(uuid.uuid4())
-        is_new_cart = True
+    if not body or type(body.get('products')) != list:
+        response['error'] = 'products key should be a list or array'
+        return response
 
-    else:
-        shopping_cart_info = dict(check_shopping_cart[0])
+    # Quantities requested per product, merging repeated lines.
+    quantities = {}
 
-        check_order = db.execute(
-            'SELECT * FROM order_info '
-            'WHERE order_id = ? '
-            'LIMIT 1',
-            (shopping_cart_info['cart_id'],)
-        ).fetchall()
+    for product in body['products']:
+        if type(product) != dict or type(product.get('product_id')) != str or type(product.get('quantity')) != int or product['quantity'] < 1:
+            response['error'] = 'Each product needs a product_id and a positive integer quantity.'
+            return response
 
-        if len(check_order) != 0:
-            print('stuck here 2')
-            cart_id = str(uuid.uuid4())
-            is_new_cart = True
-
-        else:
-            cart_id = shopping_cart_info['cart_id']
-
-    if is_new_cart:
-        try:
-            db.execute(
-                f'INSERT INTO shopping_cart_info(cart_id, username, created_at) VALUES (?, ?, ?)',
-                (
-                    cart_id,
-                    username,
-                    created_at
-                )
-            )
-            db.commit()
+        quantities[product['product_id']] = quantities.get(product['product_id'], 0) + product['quantity']
 
-        except db.IntegrityError:
-            response['error'] = f'Product with id "{cart_id}" already exists.'
-            return response
+    stock = {}
 
-    added_products = request.get_json()['products']
+    for chunk in chunked(quantities):
+        placeholders = ', '.join('?' * len(chunk))
 
-    for product in added_products:
-        check_product = db.execute(
-            'SELECT * FROM product '
-            'WHERE product_id = ? '
-            'LIMIT 1',
-            (product['product_id'],)
+        products = db.execute(
+            'SELECT product_id, in_stock FROM product '
+            f'WHERE product_id IN ({placeholders})',
+            chunk
         ).fetchall()
 
-        if len(check_product) == 0:
-            response['error'] = f'No such product with the id = {product["product_id"]}'
-            return response
+        for product in products:
+            stock[product['product_id']] = product['in_stock']
 
-        previous_status = db.execute(
-            'SELECT * FROM product_by_cart '
-            'WHERE cart_id = ? AND product_id = ? ',
-            (cart_id, product['product_id'],)
+    shopping_cart_info = get_active_cart(db, username)
+
+    if shopping_cart_info is not None:
+        cart_products = db.execute(
+            'SELECT product_id, quantity FROM product_by_cart '
+            'WHERE cart_id = ?',
+            (shopping_cart_info['cart_id'],)
         ).fetchall()
 
-        if len(previous_status) != 0:
-            product['quantity'] += previous_status[0]['quantity']
+        for product in cart_products:
+            if product['product_id'] in quantities:
+                quantities[product['product_id']] += product['quantity']
 
-        product_info = dict(check_product[0])
+    for product_id, quantity in quantities.items():
+        if product_id not in stock:
+            response['error'] = f'No such product with the id = {product_id}'
+            return response
 
-        if product_info['in_stock'] < product['quantity']:
-            response['error'] = f'Only {product_info["in_stock"]} items available of product id = {product["product_id"]}'
+        if stock[product_id] < quantity:
+            response['error'] = f'Only {stock[product_id]} items available of product id = {product_id}'
             return response
 
-        try:
-            db.execute(
-                f'INSERT INTO product_by_cart(cart_id, product_id, quantity, added_at) VALUES (?, ?, ?, ?)',
-                (
-                    cart_id,
-                    product['product_id'],
-                    product['quantity'],
-                    created_at
+    try:
+        with db:
+            if shopping_cart_info is None:
+                cart_id = str(uuid.uuid4())
+
+                db.execute(
+                    f"INSERT INTO shopping_cart_info(cart_id, username, status, created_at) VALUES (?, ?, 'active', ?)",
+                    (
+                        cart_id,
+                        username,
+                        created_at
+                    )
                 )
-            )
-            db.commit()
-        except db.IntegrityError:
-            db.execute(
-                'UPDATE product_by_cart SET quantity = ?, updated_at = ? '
-                'WHERE cart_id = ? AND product_id = ?',
-                (product['quantity'], created_at, cart_id, product['product_id'])
-            )
-            db.commit()
-
-    response['isSuccess'] = True
-    return response
-
-
-@bp.route('/get-products-in-cart', methods=['GET'])
-@login_required
-def get_products_by_cart():
-    response = {
-        'isSuccess': False,
-        'operation': 'Get products in the cart'
-    }
 
-    db = get_db()
-    username = g.user['username']
+            else:
+                cart_id = shopping_cart_info['cart_id']
 
-    check_shopping_cart = db.execute(
-        'SELECT * FROM shopping_cart_info '
-        'WHERE username = ? '
-        'ORDER BY created_at DESC '
-        'LIMIT 1',
-        (username,)
-    ).fetchall()
+            db.executemany(
+                'INSERT INTO product_by_cart(cart_id, product_id, quantity, added_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(cart_id, product_id) DO UPDATE SET quantity = excluded.quantity, updated_at = excluded.added_at',
+                [(cart_id, product_id, quantity, created_at) for product_id, quantity in quantities.items()]
+            )
 
-    if len(check_shopping_cart) == 0:
-        response['error'] = 'No products in the cart'
+    except db.IntegrityError:
+        # A concurrent request opened the active cart first.
+        response['error'] = 'The shopping cart changed while adding products. Please try again.'
         return response
 
-    else:
-        shopping_cart_info = dict(check_shopping_cart[0])
+    touch_cart()
+    get_cart(db, username)
 
-        print(username)
-        print(shopping_cart_info)
+    response['isSuccess'] = True
+    return response
 
-        check_order = db.execute(
-            'SELECT * FROM order_info '
-            'WHERE order_id = ? '
-            'LIMIT 1',
-            (shopping_cart_info['cart_id'],)
-        ).fetchall()
 
-        if len(check_order) != 0:
-            response['error'] = 'No products in the cart'
-            return response
+def load_cart(db, username):
+    """Return the lines and totals of the user's active cart, or {} when it is empty."""
+    shopping_cart_info = get_active_cart(db, username)
 
-        else:
-            cart_id = shopping_cart_info['cart_id']
+    if shopping_cart_info is None:
+        return {}
 
     products = db.execute(
-        'SELECT pbc.product_id, p.product_name, pbc.quantity, sci.username, sci.created_at, sci.updated_at, SUM((p.price - p.discount) * pbc.quantity) AS product_total_price '
+        'SELECT pbc.product_id, p.product_name, pbc.quantity, (p.price - p.discount) * pbc.quantity AS product_total_price '
         'FROM product_by_cart AS pbc '
         'JOIN product AS p '
         'ON pbc.product_id = p.product_id '
-        'JOIN shopping_cart_info AS sci '
-        'ON sci.cart_id = pbc.cart_id '
         'WHERE pbc.cart_id = ? '
-        'GROUP BY pbc.product_id '
-        'ORDER BY sci.created_at ASC ',
-        (cart_id,)
+        'ORDER BY pbc.product_id ASC',
+        (shopping_cart_info['cart_id'],)
     ).fetchall()
 
     if len(products) == 0:
-        response['error'] = 'No such cart found'
-        return response
+        return {}
 
     results = []
-    username = None
-    created_at = None
-    updated_at = None
     total_price = 0
 
     for i in products:
         formatted_data = dict(i)
+        formatted_data['product_total_price'] = round(formatted_data['product_total_price'], 2)
+        total_price += formatted_data['product_total_price']
+        results.append(formatted_data)
 
-        if not username:
-            username = formatted_data['username']
+    return {
+        'username': shopping_cart_info['username'],
+        'created_at': shopping_cart_info['created_at'],
+        'updated_at': shopping_cart_info['updated_at'],
+        'total_price': round(total_price, 2),
+        'products': results
+    }
 
-        if not created_at:
-            created_at = formatted_data['created_at']
 
-        if not updated_at:
-            updated_at = formatted_data['updated_at']
+def get_cart_version(db, username):
+    """Return what a cached cart has to match to be current, or None without an active cart.
+
+    The cart version is bumped by every write to the cart's lines and the
+    price revision by every write to CART_PRICE_COLUMNS or product delete,
+    so a write made by any worker changes one of them. Stock updates from
+    checkouts change neither.
+    """
+    version = db.execute(
+        'SELECT sci.cart_id, sci.version, cr.price_revision FROM shopping_cart_info AS sci '
+        'JOIN catalog_revision AS cr '
+        'ON cr.id = 1 '
+        "WHERE sci.username = ? AND sci.status = 'active'",
+        (username,)
+    ).fetchone()
+
+    return tuple(version) if version is not None else None
+
+
+def get_cart(db, username):
+    """Return the user's cart as load_cart does, from the cache while it is current.
+
+    An entry is served without any SQL while the session's cart token is
+    the one it was loaded under, so the user's own writes are seen by every
+    worker at once. Writes by others, such as price changes, are seen once
+    the entry is older than CART_CACHE_REVALIDATE_AFTER seconds and its
+    version no longer matches.
+    """
+    token = session.get('cart_token')
+    cached = cart_cache.get(username)
+    now = time.monotonic()
+
+    if cached is not None and cached[0] == token and now - cached[2] < current_app.config['CART_CACHE_REVALIDATE_AFTER']:
+        return cached[3]
+
+    # Read the version before the cart, so a cart loaded after a concurrent
+    # write is cached under a version that is already out of date, never a
+    # newer one.
+    version = get_cart_version(db, username)
+
+    if version is None:
+        cart_cache.delete(username)
+        return {}
+
+    if cached is not None and cached[0] == token and cached[1] == version:
+        cart = cached[3]
+    else:
+        cart = load_cart(db, username)
+
+    cart_cache.set(username, (token, version, now, cart))
+    return cart
 
-        formatted_data.pop('username')
-        formatted_data.pop('created_at')
-        formatted_data.pop('updated_at')
-        formatted_data['product_total_price'] = round(formatted_data['product_total_price'], 2)
-        total_price += formatted_data['product_total_price']
-        results.append(formatted_data)
+
+@bp.route('/get-products-in-cart', methods=['GET'])
+@login_required
+def get_products_by_cart():
+    response = {
+        'isSuccess': False,
+        'operation': 'Get products in the cart'
+    }
+
+    cart = get_cart(get_db(), g.user['username'])
+
+    if not cart:
+        response['error'] = 'No products in the cart'
+        return response
 
     response['isSuccess'] = True
-    response['username'] = username
-    response['created_at'] = created_at
-    response['updated_at'] = updated_at
-    response['total_price'] = round(total_price, 2)
-    response['products'] = results
+    response.update(cart)
     return response
 
 
@@ -225,34 +254,13 @@ def delete_from_shopping_cart(product_id):
     db = get_db()
     username = g.user['username']
 
-    check_shopping_cart = db.execute(
-        'SELECT * FROM shopping_cart_info '
-        'WHERE username = ? '
-        'ORDER BY created_at DESC '
-        'LIMIT 1',
-        (username,)
-    ).fetchall()
+    shopping_cart_info = get_active_cart(db, username)
 
-    if len(check_shopping_cart) == 0:
+    if shopping_cart_info is None:
         response['error'] = 'No products in the cart'
         return response
 
-    else:
-        shopping_cart_info = dict(check_shopping_cart[0])
-
-        check_order = db.execute(
-            'SELECT * FROM order_info '
-            'WHERE order_id = ? '
-            'LIMIT 1',
-            (shopping_cart_info['cart_id'],)
-        ).fetchall()
-
-        if len(check_order) != 0:
-            response['error'] = 'No products in the cart'
-            return response
-
-        else:
-            cart_id = shopping_cart_info['cart_id']
+    cart_id = shopping_cart_info['cart_id']
 
     check_product_in_cart = db.execute(
         'SELECT * FROM product_by_cart '
@@ -271,6 +279,8 @@ def delete_from_shopping_cart(product_id):
         (cart_id, product_id)
     )
     db.commit()
+    touch_cart()
+    get_cart(db, username)
 
     response['isSuccess'] = True
     return response
@@ -13,4 +13,10 @@ setup(
         'elasticsearch_dsl',
         'gunicorn'
     ],
+    extras_require={
+        'redis': ['redis'],
+        'orjson': ['orjson'],
+        'brotli': ['brotli'],
+        'asgi': ['uvicorn'],
+    },
 )
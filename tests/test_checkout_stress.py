@@ -0,0 +1,17 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from checkout_stress import run_checkout_stress  # noqa: E402
+
+
+def test_concurrent_checkouts_never_oversell():
+    stock, quantity = 12, 3
+    result = run_checkout_stress('client', customers=20, stock=stock, quantity=quantity)
+
+    assert result['accepted'] * quantity <= stock
+    assert result['lowest_stock'] >= 0
+    assert result['ordered'] == result['accepted'] * quantity
+    assert result['total_sold'] == result['ordered']
+    assert result['in_stock'] == stock - result['ordered']
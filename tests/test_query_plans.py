@@ -0,0 +1,17 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from query_plans import check_plans, collect_statements  # noqa: E402
+
+
+def test_queries_avoid_full_scans():
+    results = check_plans(collect_statements())
+    failures = [
+        f'[{endpoint}] {sql}\n' + '\n'.join(f'    {detail}' for detail in plan)
+        for sql, endpoint, plan, scans in results if scans
+    ]
+
+    assert results
+    assert not failures, 'Statements reading a whole table or index:\n' + '\n'.join(failures)